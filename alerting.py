@@ -0,0 +1,81 @@
+import threading
+
+from config import Config
+
+UNCHANGED = 'unchanged'
+PENDING = 'pending'
+CONFIRMED = 'confirmed'
+
+
+class ServiceState:
+    __slots__ = ('confirmed', 'candidate', 'streak')
+
+    def __init__(self, confirmed):
+        self.confirmed = confirmed
+        self.candidate = None
+        self.streak = 0
+
+
+class AlertStateTracker:
+    """Máquina de estados por servicio para suprimir alertas por oscilaciones.
+
+    Un cambio de estado solo se confirma tras N fallos (o éxitos)
+    consecutivos; mientras tanto queda pendiente y el servicio se vuelve
+    a verificar pronto para confirmarlo o descartarlo.
+    """
+
+    def __init__(self, failures_to_confirm=None, successes_to_confirm=None):
+        self.failures_to_confirm = failures_to_confirm or Config.ALERT_CONFIRM_FAILURES
+        self.successes_to_confirm = successes_to_confirm or Config.ALERT_CONFIRM_SUCCESSES
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def observe(self, service_id, is_up, last_known=None):
+        """Registra un resultado y devuelve UNCHANGED, PENDING o CONFIRMED"""
+        with self._lock:
+            state = self._states.get(service_id)
+            if state is None:
+                state = self._states[service_id] = ServiceState(last_known)
+
+            if state.confirmed is None:
+                # Primera verificación: se adopta el estado sin alertar
+                state.confirmed = is_up
+                return UNCHANGED
+
+            if is_up == state.confirmed:
+                state.candidate = None
+                state.streak = 0
+                return UNCHANGED
+
+            if state.candidate == is_up:
+                state.streak += 1
+            else:
+                state.candidate = is_up
+                state.streak = 1
+
+            needed = self.successes_to_confirm if is_up else self.failures_to_confirm
+            if state.streak < needed:
+                return PENDING
+
+            state.confirmed = is_up
+            state.candidate = None
+            state.streak = 0
+            return CONFIRMED
+
+    def confirmed(self, service_id):
+        """Último estado confirmado (True, False o None si aún no se conoce)"""
+        state = self._states.get(service_id)
+        return state.confirmed if state is not None else None
+
+    def forget(self, service_ids):
+        """Descarta el estado de los servicios indicados (se volverá a sembrar)"""
+        with self._lock:
+            for service_id in service_ids:
+                self._states.pop(service_id, None)
+
+    def retain(self, service_ids):
+        """Olvida los servicios que ya no existen"""
+        service_ids = set(service_ids)
+        with self._lock:
+            for service_id in [sid for sid in self._states if sid not in service_ids]:
+                del self._states[service_id]
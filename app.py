@@ -1,16 +1,35 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from bot import MonitoringBot
-from monitoring import ServiceMonitor
-from database import DatabaseManager
+from stats import StatsManager
+from leader import LeaderElection
+from notifier import OutboxNotifier
+from service_io import ServiceImporter, export_services, detect_format, CSV, JSON
+from check_jobs import CheckJobManager, job_summary, sse_events, ndjson_events
+import metrics
 from config import Config
+import hmac
+import json
 import threading
 import time
+from datetime import datetime, timedelta
+from functools import wraps
 from apscheduler.schedulers.background import BackgroundScheduler
 
 app = Flask(__name__)
 bot = MonitoringBot()
-monitor = ServiceMonitor()
-db = DatabaseManager()
+# Compartir el monitor (y su motor de verificación) con el bot
+monitor = bot.monitor
+db = bot.db
+stats = StatsManager(db)
+# Solo el líder (sin modo fragmentado) lleva el estado y las alertas de los destinos
+check_jobs = CheckJobManager(monitor, owns_state=lambda: leader.is_leader and not Config.PROBE_SHARDING)
+
+# Métricas calculadas en el momento de exponerlas
+metrics.gauge_function('notifier_queue_depth', 'Notificaciones pendientes de enviar', lambda: bot.notifier.pending)
+metrics.gauge_function('monitor_scheduled_services', 'Servicios en el planificador de este proceso', lambda: len(monitor.scheduler))
+metrics.gauge_function('db_pool_checked_out', 'Conexiones a la base de datos en uso', lambda: db.pool_stats().get('checked_out', 0))
+metrics.gauge_function('probe_open_circuits', 'Hosts con el circuito abierto', lambda: monitor.engine.breakers.open_count())
+metrics.gauge_function('leader', 'Si este proceso es el líder (1) o no (0)', lambda: int(leader.is_leader))
 
 # Configurar el scheduler para monitoreo periódico
 scheduler = BackgroundScheduler()
@@ -19,14 +38,69 @@ def scheduled_monitoring():
     """Tarea programada para monitorear servicios"""
     with app.app_context():
         try:
-            print("🔍 Ejecutando monitoreo programado...")
             if bot.application:
-                monitor.check_all_services(bot.application.bot)
+                results = monitor.check_due_services(bot.notifier)
+                if results:
+                    print(f"🔍 Monitoreo programado: {len(results)} servicios verificados")
             else:
                 print("Bot no inicializado, omitiendo monitoreo...")
         except Exception as e:
             print(f"Error en monitoreo programado: {e}")
 
+def drain_alert_outbox():
+    """Envía las alertas que los workers de verificación dejaron en la cola de salida"""
+    if not bot.application:
+        return
+    try:
+        alerts = db.pop_alerts()
+        for chat_id, payload in alerts:
+            bot.notifier.enqueue_batched(chat_id, OutboxNotifier.decode(payload), monitor.render_status_changes)
+        if alerts:
+            print(f"📬 Alertas de los workers encoladas: {len(alerts)}")
+    except Exception as e:
+        print(f"Error leyendo la cola de alertas: {e}")
+
+def history_maintenance():
+    """Agrega el historial de verificaciones y expira los datos antiguos"""
+    try:
+        summary = monitor.history.run_maintenance()
+        if any(summary.values()):
+            print(f"🗄️ Mantenimiento del historial: {summary}")
+        orphans = db.delete_orphan_targets()
+        if orphans:
+            print(f"🧹 Destinos sin servicios eliminados: {orphans}")
+        db.delete_old_service_changes(time.time() - Config.SERVICE_CHANGE_RETENTION_SECONDS)
+        db.delete_old_check_jobs(time.time() - Config.CHECK_JOB_RETENTION_SECONDS)
+    except Exception as e:
+        print(f"Error en mantenimiento del historial: {e}")
+
+def session_cleanup():
+    """Elimina las conversaciones abandonadas"""
+    try:
+        cutoff = datetime.now() - timedelta(seconds=Config.CONVERSATION_TTL_SECONDS)
+        deleted = db.delete_stale_user_sessions(cutoff)
+        if deleted:
+            print(f"🧹 Conversaciones abandonadas eliminadas: {deleted}")
+    except Exception as e:
+        print(f"Error limpiando conversaciones: {e}")
+
+def require_api_token(view):
+    """Exige el token de `Config.API_TOKEN` (Authorization: Bearer <token>).
+    
+    Estas rutas leen o modifican los servicios de cualquier chat, así que
+    sin token configurado no están disponibles.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not Config.API_TOKEN:
+            return jsonify({"status": "error", "message": "API no configurada (API_TOKEN)"}), 404
+        header = request.headers.get('Authorization', '')
+        token = header[len('Bearer '):] if header.startswith('Bearer ') else ''
+        if not hmac.compare_digest(token.encode('utf-8'), Config.API_TOKEN.encode('utf-8')):
+            return jsonify({"status": "error", "message": "Token de la API inválido"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
 @app.route('/')
 def home():
     return jsonify({
@@ -37,32 +111,160 @@ def home():
 
 @app.route('/health')
 def health():
-    return jsonify({"status": "healthy"})
+    return jsonify({"status": "healthy", "db_pool": db.pool_stats()})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métricas en formato de exposición de Prometheus"""
+    return Response(metrics.registry.expose(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/services/<int:service_id>/stats')
+@require_api_token
+def service_stats(service_id):
+    """Disponibilidad, percentiles de latencia y caídas de un servicio"""
+    try:
+        if 'start' in request.args:
+            start = datetime.fromisoformat(request.args['start'])
+            end = datetime.fromisoformat(request.args['end']) if 'end' in request.args else datetime.now()
+            result = stats.service_stats(service_id, start, end)
+        else:
+            result = stats.window_stats(service_id, days=float(request.args.get('days', 30)))
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+@app.route('/services/import', methods=['POST'])
+@require_api_token
+def import_services():
+    """Importación masiva (CSV o JSON) leyendo el cuerpo de la petición en streaming"""
+    chat_id = request.args.get('chat_id')
+    fmt = request.args.get('format') or detect_format(content_type=request.content_type)
+    if not chat_id or fmt not in (CSV, JSON):
+        return jsonify({"status": "error", "message": "Se requieren chat_id y format (csv o json)"}), 400
+    try:
+        summary = ServiceImporter(db).import_stream(chat_id, request.stream, fmt)
+        return jsonify({"status": "success", **summary})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/services/export')
+@require_api_token
+def export_services_endpoint():
+    """Exportación de los servicios de un chat en streaming (CSV o JSON Lines)"""
+    chat_id = request.args.get('chat_id')
+    fmt = request.args.get('format', CSV)
+    if not chat_id or fmt not in (CSV, JSON):
+        return jsonify({"status": "error", "message": "Se requieren chat_id y format (csv o json)"}), 400
+    mimetype = 'text/csv' if fmt == CSV else 'application/x-ndjson'
+    filename = f"servicios-{chat_id}.{'csv' if fmt == CSV else 'jsonl'}"
+    return Response(
+        stream_with_context(export_services(db, chat_id, fmt)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
-    """Webhook para Telegram (opcional, si se usa webhook en lugar de polling)"""
-    update = request.get_json()
-    if bot.application:
-        bot.application.update_queue.put(update)
+    """Webhook para Telegram (si está configurado WEBHOOK_URL, en lugar de polling)"""
+    if not Config.WEBHOOK_URL:
+        return jsonify({"status": "error", "message": "Webhook no configurado"}), 404
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not hmac.compare_digest(token, bot.webhook_secret):
+        return jsonify({"status": "error", "message": "Token secreto inválido"}), 403
+    
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"status": "error", "message": "Cuerpo JSON inválido"}), 400
+    if not bot.running:
+        # Este worker no es el líder: el update se le pasa a través de la base de datos
+        if not isinstance(payload.get('update_id'), int):
+            return jsonify({"status": "error", "message": "Update no válido: falta update_id"}), 400
+        try:
+            db.add_webhook_update(json.dumps(payload))
+        except Exception as e:
+            print(f"Error encolando un update para el líder: {e}")
+            return jsonify({"status": "error", "message": "Bot no disponible"}), 503
+        return jsonify({"status": "ok"})
+    
+    try:
+        accepted = bot.submit_update(payload)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if not accepted:
+        # Bot saturado (o parándose): Telegram reintentará
+        return jsonify({"status": "error", "message": "Bot no disponible"}), 503
     return jsonify({"status": "ok"})
 
 @app.route('/check-now', methods=['POST'])
+@require_api_token
 def check_now():
-    """Endpoint para forzar verificación inmediata"""
+    """Lanza una verificación inmediata en segundo plano y devuelve su id al instante.
+    
+    Filtros opcionales: chat_id y service_ids (lista separada por comas, o
+    lista JSON en el cuerpo). Si ya hay un job en curso para el mismo
+    alcance se devuelve ese. Con ?stream=1 (o Accept: text/event-stream)
+    la respuesta emite directamente los resultados del job.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        payload = {}
+    chat_id = request.args.get('chat_id') or payload.get('chat_id')
+    service_ids = request.args.get('service_ids') or payload.get('service_ids')
+    try:
+        if isinstance(service_ids, str):
+            service_ids = [value for value in service_ids.split(',') if value.strip()]
+        service_ids = {int(value) for value in service_ids or ()}
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "service_ids debe ser una lista de enteros"}), 400
+    
     try:
-        results = monitor.check_all_services(bot.application.bot if bot.application else None)
-        return jsonify({
-            "status": "success",
-            "checked_services": len(results),
-            "results": [{
-                "service": result['service'].name,
-                "status": result['status'],
-                "status_code": result.get('status_code', 0)
-            } for result in results]
-        })
+        job_id, joined = check_jobs.start(chat_id, service_ids, bot.notifier if bot.application else None)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
+    
+    if request.args.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+        return _job_stream(job_id, request.args.get('format'), 0)
+    return jsonify({
+        "status": "accepted",
+        "job_id": job_id,
+        "joined": joined,
+        "status_url": f"/check-now/{job_id}",
+        "events_url": f"/check-now/{job_id}/events"
+    }), 202
+
+@app.route('/check-now/<job_id>')
+@require_api_token
+def check_job_status(job_id):
+    """Estado y resultados hasta el momento de una verificación inmediata"""
+    job = db.get_check_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job no encontrado"}), 404
+    results = []
+    rows = db.get_check_job_results(job_id)
+    while rows:
+        results.extend(json.loads(row.payload) for row in rows)
+        rows = db.get_check_job_results(job_id, rows[-1].id)
+    return jsonify({"status": "success", **job_summary(job), "results": results})
+
+@app.route('/check-now/<job_id>/events')
+@require_api_token
+def check_job_events(job_id):
+    """Resultados de una verificación inmediata a medida que llegan
+    (Server-Sent Events, o JSON Lines con ?format=ndjson)"""
+    if db.get_check_job(job_id) is None:
+        return jsonify({"status": "error", "message": "Job no encontrado"}), 404
+    # Reanudar tras el último evento recibido
+    last_id = request.headers.get('Last-Event-ID', '')
+    return _job_stream(job_id, request.args.get('format'), int(last_id) if last_id.isdigit() else 0)
+
+def _job_stream(job_id, fmt, after_id):
+    if fmt == 'ndjson':
+        return Response(stream_with_context(ndjson_events(db, job_id, after_id)), mimetype='application/x-ndjson')
+    return Response(
+        stream_with_context(sse_events(db, job_id, after_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 def start_bot():
     """Inicia el bot de Telegram en un hilo separado"""
@@ -73,30 +275,93 @@ def start_scheduler():
     """Inicia el scheduler para monitoreo periódico"""
     print("⏰ Iniciando scheduler de monitoreo...")
     
-    # Verificar servicios cada minuto
+    if Config.PROBE_SHARDING:
+        # Las verificaciones las hacen los procesos worker.py; aquí solo se envían sus alertas
+        scheduler.add_job(
+            func=drain_alert_outbox,
+            trigger='interval',
+            seconds=Config.SCHEDULER_TICK_SECONDS,
+            id='alert_outbox'
+        )
+    else:
+        # Cada tick verifica solo los servicios vencidos según su intervalo
+        scheduler.add_job(
+            func=scheduled_monitoring,
+            trigger='interval',
+            seconds=Config.SCHEDULER_TICK_SECONDS,
+            id='service_monitoring'
+        )
+    
+    scheduler.add_job(
+        func=history_maintenance,
+        trigger='interval',
+        minutes=Config.HISTORY_MAINTENANCE_MINUTES,
+        id='history_maintenance'
+    )
+    
     scheduler.add_job(
-        func=scheduled_monitoring,
+        func=session_cleanup,
         trigger='interval',
-        minutes=1,
-        id='service_monitoring'
+        seconds=Config.CONVERSATION_TTL_SECONDS,
+        id='session_cleanup'
     )
     
     scheduler.start()
     print("✅ Scheduler iniciado correctamente")
 
-if __name__ == '__main__':
-    # Inicializar base de datos
-    from models import init_db
-    init_db()
-    print("✅ Base de datos inicializada")
-    
-    # Iniciar scheduler
-    start_scheduler()
+bot_thread = None
+
+def on_elected():
+    """Este proceso pasa a ser el único que planifica verificaciones y atiende al bot"""
+    global bot_thread
+    if scheduler.running:
+        scheduler.resume()
+    else:
+        start_scheduler()
     
-    # Iniciar bot en un hilo separado
-    bot_thread = threading.Thread(target=start_bot)
-    bot_thread.daemon = True
+    bot_thread = threading.Thread(target=start_bot, name='telegram-bot', daemon=True)
     bot_thread.start()
+
+def on_revoked():
+    """Otro proceso ha tomado el liderazgo: dejar de planificar y de hacer polling"""
+    if scheduler.running:
+        scheduler.pause()
+    bot.stop()
+    if bot_thread is not None:
+        bot_thread.join(timeout=Config.LEADER_LEASE_SECONDS)
+
+leader = LeaderElection('scheduler', on_elected=on_elected, on_revoked=on_revoked)
+_background_lock = threading.Lock()
+_background_started = False
+
+def start_background_tasks(init_schema=True):
+    """Inicializa la base de datos y presenta el proceso a la elección de líder.
+    
+    Se llama una vez por proceso: desde `__main__` o desde el hook
+    `post_worker_init` de gunicorn (ver gunicorn.conf.py). Con gunicorn el
+    esquema ya lo creó el proceso maestro y los workers no lo repiten.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    
+    if init_schema:
+        from models import init_db
+        init_db()
+        print("✅ Base de datos inicializada")
+    
+    leader.start()
+
+def stop_background_tasks():
+    """Cede el liderazgo para que otro proceso lo tome sin esperar a que expire"""
+    leader.stop()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+
+if __name__ == '__main__':
+    start_background_tasks()
     
     # Iniciar servidor Flask
     print(f"🌐 Iniciando servidor web en puerto {Config.PORT}...")
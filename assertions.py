@@ -0,0 +1,380 @@
+import asyncio
+import codecs
+import json
+import os
+import re
+import select
+import struct
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+from config import Config
+
+# Tipos de comprobación de contenido guardados en MonitoredService.assertion_type
+CONTAINS = 'contains'
+REGEX = 'regex'
+JSON = 'json'
+ASSERTION_TYPES = (CONTAINS, REGEX, JSON)
+
+
+class Assertion:
+    """Comprobación de contenido ya compilada; `start()` crea el evaluador de cada petición.
+
+    Los evaluadores reciben el cuerpo por trozos con `await feed(chunk)`,
+    que devuelve True/False en cuanto el resultado está decidido (para
+    cerrar la respuesta sin leer el resto) o None si aún hace falta más
+    cuerpo. `await finish()` da el resultado al terminar el cuerpo. La memoria usada
+    está acotada por `Config.ASSERTION_WINDOW_BYTES`, sea cual sea el
+    tamaño de la página.
+    """
+
+    def start(self):
+        raise NotImplementedError
+
+
+class ContainsAssertion(Assertion):
+    def __init__(self, text):
+        self.needle = text.encode()
+
+    def start(self):
+        return ContainsMatcher(self.needle)
+
+
+class ContainsMatcher:
+    def __init__(self, needle):
+        self.needle = needle
+        self._tail = b''
+
+    async def feed(self, chunk):
+        data = self._tail + chunk
+        if self.needle in data:
+            return True
+        # Solo hace falta conservar lo justo para una coincidencia partida entre trozos
+        self._tail = data[-(len(self.needle) - 1):] if len(self.needle) > 1 else b''
+        return None
+
+    async def finish(self):
+        return False
+
+
+class RegexTimeout(Exception):
+    """La búsqueda de una expresión regular superó `Config.ASSERTION_REGEX_TIMEOUT`"""
+
+
+class RegexAssertion(Assertion):
+    """Expresión regular sobre una ventana deslizante del cuerpo.
+
+    Las coincidencias más largas que media ventana pueden no encontrarse.
+    Se rechazan las expresiones demasiado largas, con cuantificadores
+    anidados (`(a+)+`) o con referencias a grupos, que son las que
+    provocan retroceso catastrófico; aun así la búsqueda corre fuera del
+    event loop y con tiempo máximo (ver RegexSandbox).
+    """
+
+    def __init__(self, pattern):
+        if len(pattern) > Config.ASSERTION_REGEX_MAX_LENGTH:
+            raise ValueError(f"La expresión regular supera los {Config.ASSERTION_REGEX_MAX_LENGTH} caracteres")
+        self.pattern = pattern.encode()
+        check_regex(sre_parse.parse(self.pattern))
+
+    def start(self):
+        return RegexMatcher(self.pattern, Config.ASSERTION_WINDOW_BYTES)
+
+
+def check_regex(parsed, in_repeat=False):
+    """Lanza ValueError si la expresión (ya analizada) puede retroceder sin límite"""
+    for op, value in parsed:
+        name = str(op)
+        if name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            _, high, body = value
+            repeats = high > 1
+            if repeats and in_repeat:
+                raise ValueError("La expresión regular tiene cuantificadores anidados")
+            check_regex(body, in_repeat or repeats)
+        elif name in ('GROUPREF', 'GROUPREF_EXISTS'):
+            raise ValueError("La expresión regular no puede usar referencias a grupos")
+        elif name == 'SUBPATTERN':
+            check_regex(value[-1], in_repeat)
+        elif name in ('ASSERT', 'ASSERT_NOT'):
+            check_regex(value[1], in_repeat)
+        elif name == 'ATOMIC_GROUP':
+            check_regex(value, in_repeat)
+        elif name == 'BRANCH':
+            for branch in value[1]:
+                check_regex(branch, in_repeat)
+
+
+class RegexMatcher:
+    def __init__(self, pattern, window):
+        self.pattern = pattern
+        self.window = window
+        self._buffer = b''
+
+    async def feed(self, chunk):
+        for start in range(0, len(chunk), self.window // 2):
+            self._buffer += chunk[start:start + self.window // 2]
+            if await REGEX_SANDBOX.search(self.pattern, self._buffer):
+                return True
+            # Conservar media ventana para coincidencias que crucen el corte
+            self._buffer = self._buffer[-(self.window // 2):]
+        return None
+
+    async def finish(self):
+        return False
+
+
+class RegexSandbox:
+    """Búsquedas de expresiones regulares en procesos aparte con tiempo máximo.
+
+    El módulo re no suelta el GIL ni se puede interrumpir, así que una
+    búsqueda lenta en el event loop del motor pararía todas las
+    verificaciones y sus timeouts. Cada hilo del pool tiene su propio
+    proceso (`python -m assertions`), que se mata y se sustituye si una
+    búsqueda supera `Config.ASSERTION_REGEX_TIMEOUT`.
+    """
+
+    def __init__(self, workers=None, timeout=None):
+        self.timeout = timeout or Config.ASSERTION_REGEX_TIMEOUT
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or Config.ASSERTION_REGEX_WORKERS, thread_name_prefix='regex'
+        )
+        self._local = threading.local()
+        self.timeouts = 0
+
+    async def search(self, pattern, data):
+        """Si `pattern` (bytes) aparece en `data`; RegexTimeout si tarda demasiado"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._search, pattern, data)
+
+    def _search(self, pattern, data):
+        process = getattr(self._local, 'process', None)
+        if process is None or process.poll() is not None:
+            process = self._local.process = subprocess.Popen(
+                [sys.executable, '-m', 'assertions'],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            )
+        try:
+            process.stdin.write(struct.pack('>II', len(pattern), len(data)) + pattern + data)
+            process.stdin.flush()
+            ready, _, _ = select.select([process.stdout], [], [], self.timeout)
+            answer = process.stdout.read(1) if ready else b''
+        except OSError:
+            answer = b''
+        if answer not in (b'0', b'1'):
+            process.kill()
+            process.wait()
+            self._local.process = None
+            self.timeouts += 1
+            raise RegexTimeout(f"búsqueda de más de {self.timeout} s")
+        return answer == b'1'
+
+
+REGEX_SANDBOX = RegexSandbox()
+
+
+def regex_worker(requests, responses):
+    """Bucle del proceso de RegexSandbox: lee (expresión, datos) y responde 1 o 0"""
+    compile_pattern = lru_cache(maxsize=256)(re.compile)
+    while True:
+        header = requests.read(8)
+        if len(header) < 8:
+            return
+        pattern_length, data_length = struct.unpack('>II', header)
+        pattern = requests.read(pattern_length)
+        data = requests.read(data_length)
+        responses.write(b'1' if compile_pattern(pattern).search(data) else b'0')
+        responses.flush()
+
+
+class JsonPathAssertion(Assertion):
+    """Valor de un campo JSON: `ruta` (existe) o `ruta=valor` (es igual).
+
+    La ruta usa puntos y corchetes, p. ej. `status` o `checks.db[0].ok`;
+    el valor se interpreta como JSON si es posible (`true`, `200`) y si no
+    como texto.
+    """
+
+    def __init__(self, expression):
+        path, has_value, expected = expression.partition('=')
+        self.path = self.parse_path(path.strip())
+        self.has_value = bool(has_value)
+        if self.has_value:
+            expected = expected.strip()
+            try:
+                self.expected = json.loads(expected)
+            except ValueError:
+                self.expected = expected
+
+    def start(self):
+        return JsonPathMatcher(self, Config.ASSERTION_WINDOW_BYTES)
+
+    @staticmethod
+    def parse_path(path):
+        if path.startswith('$'):
+            path = path[1:].lstrip('.')
+        steps = []
+        for part in path.split('.'):
+            match = re.fullmatch(r'([^\[\]]*)((?:\[\d+\])*)', part)
+            if not match or (not match.group(1) and not match.group(2)):
+                raise ValueError(f"Ruta JSON no válida: {path}")
+            if match.group(1):
+                steps.append(match.group(1))
+            steps.extend(int(index) for index in re.findall(r'\[(\d+)\]', match.group(2)))
+        if not steps:
+            raise ValueError("La ruta JSON está vacía")
+        return tuple(steps)
+
+
+class JsonPathMatcher:
+    """Analizador JSON incremental que sigue la ruta actual sin construir el documento"""
+
+    TOKEN = re.compile(r'\s*(?:([{}\[\]:,])|("(?:[^"\\]|\\.)*")|([^\s{}\[\]:,"]+))')
+
+    def __init__(self, assertion, window):
+        self.assertion = assertion
+        self.target = assertion.path
+        self.window = window
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self._pending = ''
+        self._in_string = False
+        self._stack = []  # [tipo, clave o índice, estado]
+        self._done = False
+
+    async def feed(self, chunk):
+        text = self._decoder.decode(chunk)
+        if self._in_string and '"' not in text:
+            # La cadena pendiente sigue abierta: no hace falta volver a analizarla
+            self._pending += text
+            return False if len(self._pending) > self.window else None
+
+        self._pending += text
+        position = 0
+        while True:
+            match = self.TOKEN.match(self._pending, position)
+            # Un token que llega al final del trozo puede estar incompleto
+            if not match or match.end() == len(self._pending):
+                break
+            position = match.end()
+            result = self._token(match)
+            if result is not None:
+                return result
+        self._pending = self._pending[position:]
+        self._in_string = self._pending.lstrip().startswith('"')
+        if len(self._pending) > self.window:
+            return False  # token mayor que la ventana
+        return None
+
+    async def finish(self):
+        self._pending += self._decoder.decode(b'', final=True)
+        for match in self.TOKEN.finditer(self._pending):
+            result = self._token(match)
+            if result is not None:
+                return result
+        return False
+
+    def _token(self, match):
+        punct, string, scalar = match.groups()
+        frame = self._stack[-1] if self._stack else None
+
+        if frame and frame[0] == 'obj' and frame[2] == 'key':
+            if string:
+                frame[1] = json.loads(string)
+                frame[2] = 'colon'
+                return None
+            if punct == '}':
+                return self._close()
+            return False
+        if frame and frame[2] == 'colon':
+            frame[2] = 'value'
+            return None if punct == ':' else False
+        if frame and frame[2] == 'comma':
+            if punct == ',':
+                if frame[0] == 'obj':
+                    frame[2] = 'key'
+                else:
+                    frame[1] += 1
+                    frame[2] = 'value'
+                return None
+            if punct in ('}', ']'):
+                return self._close()
+            return False
+
+        # Comienza un valor en la ruta actual
+        if self._done:
+            return False
+        if frame and frame[0] == 'arr' and punct == ']':
+            return self._close()
+        path = tuple(item[1] for item in self._stack)
+        if punct in ('{', '['):
+            if path == self.target:
+                return not self.assertion.has_value
+            self._stack.append(['obj', None, 'key'] if punct == '{' else ['arr', 0, 'value'])
+            return None
+        if punct:
+            return False
+
+        if path == self.target:
+            try:
+                value = json.loads(string or scalar)
+            except ValueError:
+                return False
+            return not self.assertion.has_value or value == self.assertion.expected
+        self._value_done()
+        return None
+
+    def _close(self):
+        self._stack.pop()
+        path = tuple(item[1] for item in self._stack)
+        # Se cerró el contenedor donde debía estar la ruta buscada sin encontrarla
+        if len(self.target) > len(path) and self.target[:len(path)] == path:
+            return False
+        self._value_done()
+        return None
+
+    def _value_done(self):
+        if self._stack:
+            self._stack[-1][2] = 'comma'
+        else:
+            self._done = True
+
+
+@lru_cache(maxsize=1024)
+def build_assertion(kind, value):
+    """Compila una comprobación de contenido (ValueError si no es válida)"""
+    if not value:
+        raise ValueError("La comprobación necesita un valor")
+    if kind == CONTAINS:
+        return ContainsAssertion(value)
+    if kind == REGEX:
+        try:
+            return RegexAssertion(value)
+        except re.error as e:
+            raise ValueError(f"Expresión regular no válida: {e}")
+    if kind == JSON:
+        return JsonPathAssertion(value)
+    raise ValueError(f"Tipo de comprobación desconocido: {kind}")
+
+
+def assertion_for(service):
+    """Comprobación configurada para un servicio o destino, o None si solo se
+    mira el código HTTP (también si la guardada no es válida)"""
+    kind = getattr(service, 'assertion_type', None)
+    if not kind:
+        return None
+    try:
+        return build_assertion(kind, service.assertion_value)
+    except Exception as e:
+        print(f"Comprobación de contenido no válida en {service.url}: {e}")
+        return None
+
+
+if __name__ == '__main__':
+    regex_worker(sys.stdin.buffer, sys.stdout.buffer)
@@ -0,0 +1,100 @@
+"""Mide el vaciado de una ráfaga de alertas a través de NotificationDispatcher.
+
+Usa un bot falso que simula la latencia de la API y, opcionalmente, respuestas
+429. Comprueba que no se pierde ningún mensaje y que no se superan los límites
+global y por chat.
+
+Uso:
+    python benchmarks/bench_notifications.py --alerts 1000 --chats 200
+    python benchmarks/bench_notifications.py --retry-after-every 100
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telegram.error import RetryAfter
+
+from notifier import NotificationDispatcher
+
+
+class FakeBot:
+    """Bot que registra la hora de cada envío en lugar de llamar a Telegram"""
+
+    def __init__(self, latency, retry_after_every):
+        self.latency = latency
+        self.retry_after_every = retry_after_every
+        self.calls = 0
+        self.deliveries = []  # (t, chat_id, text)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        received = time.monotonic()
+        await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if self.retry_after_every and self.calls % self.retry_after_every == 0:
+            raise RetryAfter(1)
+        self.deliveries.append((received, chat_id, text))
+
+
+def max_in_window(times, window=1.0):
+    times = sorted(times)
+    best = start = 0
+    for end in range(len(times)):
+        while times[end] - times[start] >= window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+async def run(args):
+    bot = FakeBot(args.latency, args.retry_after_every)
+    dispatcher = NotificationDispatcher(global_rate=args.global_rate, per_chat_rate=args.per_chat_rate)
+    await dispatcher.start(bot)
+
+    start = time.monotonic()
+    for i in range(args.alerts):
+        dispatcher.enqueue(str(i % args.chats), f"alerta {i}")
+    while dispatcher.pending:
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - start
+    await dispatcher.stop()
+
+    per_chat = defaultdict(list)
+    order_ok = True
+    for t, chat_id, text in bot.deliveries:
+        per_chat[chat_id].append((t, int(text.split()[1])))
+    for deliveries in per_chat.values():
+        ids = [i for _, i in deliveries]
+        order_ok &= ids == sorted(ids)
+
+    # Mínimo teórico: el límite global o el del chat con más mensajes
+    busiest_chat = -(-args.alerts // args.chats)
+    ideal = max(args.alerts / args.global_rate, (busiest_chat - 1) / args.per_chat_rate)
+    print(f"alertas={args.alerts} chats={args.chats} entregadas={len(bot.deliveries)} "
+          f"reintentos={dispatcher.retried} fallidas={dispatcher.failed}")
+    print(f"tiempo de vaciado: {elapsed:.2f} s (mínimo teórico {ideal:.2f} s), "
+          f"{len(bot.deliveries) / elapsed:.1f} msg/s")
+    print(f"máximo global en 1 s: {max_in_window([t for t, _, _ in bot.deliveries])} (límite {args.global_rate})")
+    print(f"máximo por chat en 1 s: {max(max_in_window([t for t, _ in d]) for d in per_chat.values())} "
+          f"(límite {args.per_chat_rate})")
+    print(f"orden por chat conservado: {order_ok}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alerts', type=int, default=1000)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='latencia simulada de la API (s)')
+    parser.add_argument('--retry-after-every', type=int, default=0, help='responder 429 cada N llamadas')
+    parser.add_argument('--global-rate', type=float, default=30)
+    parser.add_argument('--per-chat-rate', type=float, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Benchmark del modo webhook: ráfagas de updates contra la ruta /webhook de Flask.
+
+Levanta la aplicación Flask (servidor de werkzeug con hilos) y el bot en modo
+webhook contra la Bot API falsa de fake_telegram.py, y envía una ráfaga de
+updates "📋 Mis Servicios" desde varios chats con la concurrencia indicada.
+
+Mide, para cada valor de --concurrent-updates (BOT_CONCURRENT_UPDATES):
+  - ingesta: updates aceptados por segundo y latencia de la respuesta HTTP
+    (la ruta devuelve en cuanto el update está en la cola del bot)
+  - procesado: updates respondidos por segundo, hasta que la última
+    respuesta llega a la Bot API
+
+Uso:
+    python benchmarks/bench_webhook.py --updates 5000 --concurrency 100 --concurrent-updates 1,16,64
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from urllib.request import urlopen
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+import fake_telegram
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100, help='peticiones HTTP simultáneas')
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--services-per-chat', type=int, default=5)
+    parser.add_argument('--concurrent-updates', default='1,16,64', help='valores de BOT_CONCURRENT_UPDATES')
+    parser.add_argument('--telegram-latency', type=float, default=0.02)
+    parser.add_argument('--port', type=int, default=18600)
+    parser.add_argument('--telegram-port', type=int, default=18501)
+    parser.add_argument('--output', help='fichero JSON de resultados (por defecto stdout)')
+    return parser.parse_args(argv)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * fraction), len(values) - 1)], 4)
+
+
+def make_update(update_id, chat_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'bench'},
+            'text': '📋 Mis Servicios',
+        },
+    }
+
+
+async def send_burst(args, secret, first_id):
+    import httpx
+
+    url = f'http://127.0.0.1:{args.port}/webhook'
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret}
+    latencies = []
+    rejected = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def post(index):
+            nonlocal rejected
+            payload = make_update(first_id + index, 1000 + index % args.chats)
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(url, json=payload, headers=headers)
+                latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                rejected += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(post(index) for index in range(args.updates)))
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies, rejected
+
+
+def deliveries(args):
+    return len(json.load(urlopen(f'http://127.0.0.1:{args.telegram_port}/_deliveries')))
+
+
+def main():
+    args = parse_args()
+
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'webhook.db')}"
+    os.environ['TELEGRAM_BOT_TOKEN'] = '123:bench'
+    os.environ['TELEGRAM_API_URL'] = f'http://127.0.0.1:{args.telegram_port}/bot'
+    os.environ['WEBHOOK_URL'] = f'http://127.0.0.1:{args.port}/webhook'
+
+    context = multiprocessing.get_context('spawn')
+    ready = context.Event()
+    telegram = context.Process(
+        target=fake_telegram.run, args=(args.telegram_port, args.telegram_latency, 0, ready), daemon=True
+    )
+    telegram.start()
+    if not ready.wait(30):
+        raise RuntimeError("La Bot API falsa no arrancó")
+
+    from sqlalchemy import insert
+    from werkzeug.serving import make_server
+    import models
+    from models import MonitoredService, init_db
+    from config import Config
+    import app as webapp
+
+    init_db()
+    with models.engine.begin() as conn:
+        conn.execute(insert(MonitoredService), [
+            {'name': f'svc-{chat}-{i}', 'url': f'https://svc{i}.example.com/{chat}', 'chat_id': str(1000 + chat)}
+            for chat in range(args.chats) for i in range(args.services_per_chat)
+        ])
+
+    server = make_server('127.0.0.1', args.port, webapp.app, threaded=True)
+    server.socket.listen(1024)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = []
+    first_id = 1
+    try:
+        for concurrent in [int(value) for value in args.concurrent_updates.split(',')]:
+            Config.BOT_CONCURRENT_UPDATES = concurrent
+            thread = threading.Thread(target=webapp.bot.run, daemon=True)
+            thread.start()
+            while not (webapp.bot.application and webapp.bot.application.running and webapp.bot.notifier._loop):
+                time.sleep(0.05)
+
+            already_delivered = deliveries(args)
+            start = time.perf_counter()
+            ingest_seconds, latencies, rejected = asyncio.run(send_burst(args, webapp.bot.webhook_secret, first_id))
+            expected = already_delivered + args.updates - rejected
+            while deliveries(args) < expected and time.perf_counter() - start < 300:
+                time.sleep(0.05)
+            processed_seconds = time.perf_counter() - start
+            first_id += args.updates
+
+            webapp.bot.stop()
+            thread.join(30)
+
+            result = {
+                'concurrent_updates': concurrent,
+                'updates': args.updates,
+                'rejected': rejected,
+                'ingest_s': round(ingest_seconds, 3),
+                'ingest_per_s': round(args.updates / ingest_seconds, 1),
+                'webhook_latency_s': {
+                    'p50': percentile(latencies, 0.5),
+                    'p95': percentile(latencies, 0.95),
+                    'p99': percentile(latencies, 0.99),
+                },
+                'processed_s': round(processed_seconds, 3),
+                'processed_per_s': round((expected - already_delivered) / processed_seconds, 1),
+            }
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+    finally:
+        server.shutdown()
+        telegram.terminate()
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
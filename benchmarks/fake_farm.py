@@ -0,0 +1,129 @@
+"""Granja HTTP local que simula miles de endpoints para los benchmarks.
+
+El comportamiento de cada endpoint va en la propia URL, así que el servidor
+no guarda estado por servicio:
+
+    /e/<id>?ms=25              responde 200 tras 25 ms
+    /e/<id>?ms=25&status=500   responde 500
+    /e/<id>?hang=1             no responde nunca (el cliente agota su timeout)
+    /e/<id>?flip=1             responde 200, o 503 mientras la caída simulada esté activa
+    /_flip?on=1                activa (on=1) o desactiva (on=0) la caída simulada
+
+Escucha en varias direcciones de loopback (127.0.0.1, 127.0.0.2, ...) para
+que el límite de concurrencia por host del motor se comporte como con
+servidores reales, en HTTP y opcionalmente en HTTPS con un certificado
+autofirmado generado con openssl.
+
+Uso independiente:
+    python benchmarks/fake_farm.py --hosts 50 --port 18400 --tls-port 18443
+"""
+import argparse
+import asyncio
+import os
+import ssl
+import subprocess
+import tempfile
+from urllib.parse import parse_qs
+
+
+def loopback_hosts(count):
+    return [f'127.0.0.{i}' for i in range(1, count + 1)]
+
+
+def make_certificate(hosts, directory=None):
+    """Certificado autofirmado válido para las direcciones de la granja; devuelve (cert, key)"""
+    directory = directory or tempfile.mkdtemp(prefix='bench-tls-')
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    names = ','.join(['DNS:localhost'] + [f'IP:{host}' for host in hosts])
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+        '-subj', '/CN=localhost', '-addext', f'subjectAltName={names}',
+        '-keyout', key, '-out', cert,
+    ], check=True, capture_output=True)
+    return cert, key
+
+
+class Farm:
+    def __init__(self):
+        self.flipped = False
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+
+                path, _, query = target.partition('?')
+                params = {key: values[0] for key, values in parse_qs(query).items()}
+                status = await self.respond(path, params)
+                body = b'ok\n'
+                writer.write(
+                    f'HTTP/1.1 {status} X\r\nContent-Length: {len(body)}\r\n'
+                    f'Content-Type: text/plain\r\n\r\n'.encode()
+                )
+                if method != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+        except (ConnectionError, ValueError, ssl.SSLError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, path, params):
+        if path == '/_flip':
+            self.flipped = params.get('on') == '1'
+            return 200
+        if params.get('hang'):
+            await asyncio.sleep(3600)
+        if params.get('ms'):
+            await asyncio.sleep(float(params['ms']) / 1000)
+        if params.get('flip') and self.flipped:
+            return 503
+        return int(params.get('status', 200))
+
+
+async def serve(hosts, port, tls_port=None, cert=None, key=None, ready=None):
+    farm = Farm()
+    servers = [await asyncio.start_server(farm.handle, hosts, port, backlog=4096, limit=2 ** 16)]
+    if tls_port:
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert, key)
+        servers.append(await asyncio.start_server(farm.handle, hosts, tls_port, ssl=context, backlog=4096))
+    if ready is not None:
+        ready.set()
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def run(hosts, port, tls_port=None, cert=None, key=None, ready=None):
+    """Punto de entrada para un proceso separado (multiprocessing)"""
+    try:
+        asyncio.run(serve(hosts, port, tls_port, cert, key, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hosts', type=int, default=50)
+    parser.add_argument('--port', type=int, default=18400)
+    parser.add_argument('--tls-port', type=int, default=0)
+    args = parser.parse_args()
+
+    hosts = loopback_hosts(args.hosts)
+    cert = key = None
+    if args.tls_port:
+        cert, key = make_certificate(hosts)
+        print(f"Certificado: {cert}")
+    print(f"Granja en {hosts[0]}..{hosts[-1]}, puerto {args.port}" + (f", TLS {args.tls_port}" if args.tls_port else ''))
+    run(hosts, args.port, args.tls_port, cert, key)
+
+
+if __name__ == '__main__':
+    main()
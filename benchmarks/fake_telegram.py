@@ -0,0 +1,115 @@
+"""Servidor local que imita la Bot API de Telegram para los benchmarks.
+
+Responde a getMe y sendMessage (con la latencia indicada y, opcionalmente,
+un 429 cada N envíos) y guarda la hora de recepción de cada mensaje.
+`GET /_deliveries` devuelve [[hora, chat_id, texto], ...].
+
+Con python-telegram-bot se usa así:
+    Bot(token='123:bench', base_url=f'http://127.0.0.1:{port}/bot')
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs
+
+
+class FakeTelegram:
+    def __init__(self, latency=0.0, retry_after_every=0):
+        self.latency = latency
+        self.retry_after_every = retry_after_every
+        self.calls = 0
+        self.deliveries = []
+        self.message_id = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self.respond(target, headers.get('content-type', ''), body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f'HTTP/1.1 {status} X\r\nContent-Length: {len(data)}\r\n'
+                    f'Content-Type: application/json\r\n\r\n'.encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, target, content_type, body):
+        if target.startswith('/_deliveries'):
+            return 200, self.deliveries
+
+        api_method = target.rsplit('/', 1)[-1]
+        if content_type.startswith('application/json'):
+            params = json.loads(body or b'{}')
+        else:
+            params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+        if api_method == 'getMe':
+            return 200, {'ok': True, 'result': {
+                'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'
+            }}
+        if api_method != 'sendMessage':
+            return 200, {'ok': True, 'result': True}
+
+        received = time.time()
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.retry_after_every and self.calls % self.retry_after_every == 0:
+            return 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                         'parameters': {'retry_after': 1}}
+
+        self.deliveries.append([received, params.get('chat_id'), params.get('text')])
+        self.message_id += 1
+        return 200, {'ok': True, 'result': {
+            'message_id': self.message_id,
+            'date': int(received),
+            'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+            'text': params.get('text', ''),
+        }}
+
+
+async def serve(port, latency=0.0, retry_after_every=0, ready=None):
+    api = FakeTelegram(latency, retry_after_every)
+    server = await asyncio.start_server(api.handle, '127.0.0.1', port)
+    if ready is not None:
+        ready.set()
+    await server.serve_forever()
+
+
+def run(port, latency=0.0, retry_after_every=0, ready=None):
+    """Punto de entrada para un proceso separado (multiprocessing)"""
+    try:
+        asyncio.run(serve(port, latency, retry_after_every, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=18500)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--retry-after-every', type=int, default=0)
+    args = parser.parse_args()
+    print(f"Bot API falsa en http://127.0.0.1:{args.port}/bot")
+    run(args.port, args.latency, args.retry_after_every)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,46 @@
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from telegram.error import BadRequest
+from telegram.constants import MessageLimit
 from database import DatabaseManager
 from monitoring import ServiceMonitor
+from stats import StatsManager
+from notifier import NotificationDispatcher
+from session_cache import ConversationCache
+from assertions import assertion_for, build_assertion, CONTAINS, REGEX, JSON
+import service_io
+from probes import probe_for
+from targets import group_targets
 from config import Config
-import re
+import asyncio
+import hashlib
+import json
+import tempfile
+import time
+
+# Nombres de las comprobaciones de contenido en el comando /contenido
+ASSERTION_NAMES = {'texto': CONTAINS, 'regex': REGEX, 'json': JSON}
+ASSERTION_LABELS = {value: name for name, value in ASSERTION_NAMES.items()}
+
+# Intervalo mínimo entre ediciones del mensaje de progreso
+CHECK_PROGRESS_EDIT_SECONDS = 1.5
+MAX_MESSAGE_LENGTH = MessageLimit.MAX_TEXT_LENGTH
 
 class MonitoringBot:
     def __init__(self):
         self.db = DatabaseManager()
         self.monitor = ServiceMonitor()
+        self.stats = StatsManager(self.db)
+        self.notifier = NotificationDispatcher()
+        self.conversations = ConversationCache(self.db)
         self.application = None
+        self._loop = None
+        self._stop_requested = None
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comando /start - Mensaje de bienvenida"""
         chat_id = update.effective_chat.id
-        self.db.clear_user_session(chat_id)
+        self.conversations.clear(chat_id)
         
         keyboard = [
             ["➕ Agregar Servicio", "📋 Mis Servicios"],
@@ -28,11 +54,16 @@ class MonitoringBot:
             "Puedo monitorear el estado de tus servicios web y notificarte "
             "cuando estén caídos o se recuperen.\n\n"
             "**Comandos disponibles:**\n"
-            "• ➕ Agregar Servicio: Añade una nueva URL para monitorear\n"
+            "• ➕ Agregar Servicio: Añade una nueva URL para monitorear "
+            "(http/https, tcp://host:puerto, dns://host o tls://host para la caducidad del certificado)\n"
             "• 📋 Mis Servicios: Lista todos tus servicios monitoreados\n"
             "• ⚙️ Configurar Intervalo: Cambia el tiempo de verificación\n"
             "• 🗑️ Eliminar Servicio: Elimina un servicio del monitoreo\n"
-            "• 🔍 Verificar Ahora: Verifica el estado actual de todos los servicios\n\n"
+            "• 🔍 Verificar Ahora: Verifica el estado actual de todos los servicios\n"
+            "• /estadisticas [días]: Disponibilidad y latencia de tus servicios\n"
+            "• /contenido <id> <texto|regex|json> <valor>: Exige contenido en la respuesta\n"
+            "• Envía un fichero .csv o .json para importar servicios en bloque\n"
+            "• /exportar [csv|json]: Descarga tus servicios\n\n"
             "¡Selecciona una opción del menú para comenzar!"
         )
         
@@ -45,7 +76,7 @@ class MonitoringBot:
     async def handle_add_service(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Inicia el proceso para agregar un servicio"""
         chat_id = update.effective_chat.id
-        self.db.set_user_action(chat_id, 'awaiting_service_name')
+        self.conversations.set(chat_id, 'awaiting_service_name')
         
         await update.message.reply_text(
             "📝 **Agregar Nuevo Servicio**\n\n"
@@ -69,11 +100,14 @@ class MonitoringBot:
         for service in services:
             status_emoji = "✅" if service.is_active else "❌"
             message += (
-                f"{status_emoji} **{service.name}**\n"
+                f"{status_emoji} **{service.name}** (ID: {service.id})\n"
                 f"🔗 {service.url}\n"
                 f"⏰ Intervalo: {service.check_interval // 60} minutos\n"
-                f"📅 Última verificación: {service.last_checked.strftime('%Y-%m-%d %H:%M') if service.last_checked else 'Nunca'}\n\n"
+                f"📅 Última verificación: {service.last_checked.strftime('%Y-%m-%d %H:%M') if service.last_checked else 'Nunca'}\n"
             )
+            if service.assertion_type:
+                message += f"🔎 Contenido ({ASSERTION_LABELS.get(service.assertion_type, service.assertion_type)}): `{service.assertion_value}`\n"
+            message += "\n"
         
         await update.message.reply_text(message, parse_mode='Markdown')
     
@@ -81,24 +115,251 @@ class MonitoringBot:
         """Verifica todos los servicios inmediatamente"""
         chat_id = update.effective_chat.id
         
-        await update.message.reply_text("🔍 Verificando el estado de tus servicios...")
-        
-        # Verificar servicios del usuario
-        user_services = self.db.get_user_services(chat_id)
+        # Servicios del usuario desde el registro en memoria (aplicando los últimos cambios)
+        registry = self.monitor.registry
+        await asyncio.to_thread(registry.refresh)
+        user_services = registry.for_chat(chat_id)
         if not user_services:
             await update.message.reply_text("No tienes servicios para verificar.")
             return
         
-        for service in user_services:
-            status, status_code = self.monitor.check_service(service)
+        progress = await update.message.reply_text(
+            f"🔍 Verificando el estado de tus servicios... (0/{len(user_services)})"
+        )
+        
+        # Una verificación por destino; las verificaciones corren en el loop del motor
+        targets = group_targets(user_services)
+        positions = {target.id: index for index, target in enumerate(targets)}
+        slots = [positions[service.target_id] for service in user_services]
+        engine = self.monitor.engine
+        pending = {
+            asyncio.wrap_future(engine.submit(engine.probe(target.url, assertion_for(target)))): index
+            for index, target in enumerate(targets)
+        }
+        outcomes = [None] * len(targets)
+        last_edit = time.monotonic()
+        
+        def service_outcomes():
+            return [outcomes[slot] for slot in slots]
+        
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=CHECK_PROGRESS_EDIT_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                if future.exception() is not None:
+                    # Se queda sin resultado; no afecta al resto
+                    print(f"Error verificando {targets[index].url}: {future.exception()!r}")
+                    continue
+                outcomes[index] = future.result()
             
-            if status:
-                message = f"✅ **{service.name}** - ACTIVO (Código: {status_code})"
+            # Editar el mensaje como mucho una vez por intervalo
+            if pending and time.monotonic() - last_edit >= CHECK_PROGRESS_EDIT_SECONDS:
+                await self._edit_progress(progress, self._render_check_progress(user_services, service_outcomes()))
+                last_edit = time.monotonic()
+        
+        await self._edit_progress(progress, self._render_check_progress(user_services, service_outcomes(), finished=True))
+        await asyncio.to_thread(self.monitor.save_results, targets, outcomes)
+    
+    def _render_check_progress(self, services, outcomes, finished=False):
+        done = sum(1 for outcome in outcomes if outcome is not None)
+        if not finished:
+            header = f"🔍 Verificando tus servicios... ({done}/{len(services)})"
+        else:
+            up = sum(1 for outcome in outcomes if outcome is not None and outcome.is_up)
+            header = f"🔍 **Verificación completada:** {up}/{len(services)} activos"
+        
+        lines = []
+        # Primero los caídos, que son los que interesan
+        ordered = sorted(zip(services, outcomes), key=lambda item: (item[1] is None, item[1] is not None and item[1].is_up))
+        for service, outcome in ordered:
+            if outcome is None:
+                lines.append(f"⚠️ **{service.name}** - sin resultado" if finished else f"⏳ **{service.name}**")
+            elif outcome.is_up:
+                lines.append(f"✅ **{service.name}** - ACTIVO (Código: {outcome.status_code})")
             else:
-                message = f"❌ **{service.name}** - INACTIVO"
-            
+                lines.append(f"❌ **{service.name}** - INACTIVO")
+        
+        message = header + "\n\n"
+        for index, line in enumerate(lines):
+            if len(message) + len(line) > MAX_MESSAGE_LENGTH - 50:
+                message += f"… y {len(lines) - index} más"
+                break
+            message += line + "\n"
+        return message
+    
+    async def _edit_progress(self, message, text):
+        try:
+            await message.edit_text(text, parse_mode='Markdown')
+        except BadRequest as e:
+            # Telegram rechaza ediciones sin cambios
+            if 'not modified' not in str(e).lower():
+                print(f"Error actualizando el progreso de verificación: {e}")
+    
+    async def handle_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /estadisticas [días] - Disponibilidad y latencia de los servicios"""
+        chat_id = update.effective_chat.id
+        
+        try:
+            days = int(context.args[0]) if context.args else 30
+        except ValueError:
+            days = 0
+        if days < 1:
+            await update.message.reply_text("❌ Indica un número de días válido. Ejemplo: /estadisticas 7")
+            return
+        # No hay historial más antiguo
+        days = min(days, Config.HISTORY_DAY_RETENTION_DAYS)
+        
+        # Varias consultas por servicio: fuera del event loop del bot
+        blocks = await asyncio.to_thread(self._render_stats_blocks, chat_id, days)
+        if not blocks:
+            await update.message.reply_text("No tienes servicios monitoreados.")
+            return
+        
+        header = f"📊 **Estadísticas de los últimos {days} días:**\n\n"
+        for message in self._split_message(header, blocks):
             await update.message.reply_text(message, parse_mode='Markdown')
     
+    def _render_stats_blocks(self, chat_id, days):
+        """Un bloque de texto con las estadísticas de cada servicio del chat"""
+        blocks = []
+        for service in self.db.get_user_services(chat_id):
+            stats = self.stats.window_stats(service.id, days=days)
+            if not stats['checks']:
+                blocks.append(f"**{service.name}**\nSin datos todavía\n\n")
+                continue
+            latency = stats['latency_ms']
+            block = (
+                f"**{service.name}**\n"
+                f"🟢 Disponibilidad: {stats['uptime_percent']:.2f}%\n"
+                f"📉 Caídas: {stats['outages']}\n"
+            )
+            if latency['p50'] is not None:
+                block += f"⏱️ Latencia p50/p95/p99: {latency['p50']}/{latency['p95']}/{latency['p99']} ms\n"
+            blocks.append(block + "\n")
+        return blocks
+    
+    @staticmethod
+    def _split_message(header, blocks):
+        """Agrupa los bloques en mensajes que no superan el límite de Telegram"""
+        messages = []
+        message = header
+        for block in blocks:
+            block = block[:MAX_MESSAGE_LENGTH - len(header)]
+            if len(message) + len(block) > MAX_MESSAGE_LENGTH:
+                messages.append(message)
+                message = ""
+            message += block
+        messages.append(message)
+        return messages
+    
+    async def handle_content_assertion(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /contenido <id> <texto|regex|json> <valor> - Exige contenido en la respuesta"""
+        chat_id = update.effective_chat.id
+        usage = (
+            "❌ Uso: /contenido <id> <texto|regex|json> <valor>\n"
+            "Ejemplos:\n"
+            "/contenido 3 texto Bienvenido\n"
+            "/contenido 3 json status=ok\n"
+            "/contenido 3 ninguno (elimina la comprobación)"
+        )
+        
+        args = context.args or []
+        if len(args) < 2 or not args[0].isdigit():
+            await update.message.reply_text(usage)
+            return
+        service_id = int(args[0])
+        
+        if args[1] == 'ninguno':
+            assertion_type = assertion_value = None
+        else:
+            assertion_type = ASSERTION_NAMES.get(args[1])
+            # El valor es el resto del mensaje, respetando sus espacios
+            parts = update.message.text.split(maxsplit=3)
+            assertion_value = parts[3] if len(parts) > 3 else ''
+            if not assertion_type or not assertion_value:
+                await update.message.reply_text(usage)
+                return
+            try:
+                build_assertion(assertion_type, assertion_value)
+            except ValueError as e:
+                await update.message.reply_text(f"❌ {e}")
+                return
+            service = next((item for item in self.monitor.registry.for_chat(chat_id) if item.id == service_id), None)
+            probe = probe_for(service.url) if service is not None else None
+            if service is not None and probe is None:
+                # Filas antiguas con esquemas que ya no se verifican (p. ej. ftp://)
+                await update.message.reply_text("❌ El tipo de este servicio no está soportado.")
+                return
+            if probe is not None and probe.kind != 'http':
+                await update.message.reply_text("❌ Las comprobaciones de contenido solo se aplican a URLs http/https.")
+                return
+        
+        if self.db.update_service_assertion(service_id, chat_id, assertion_type, assertion_value):
+            if assertion_type:
+                await update.message.reply_text("✅ Comprobación de contenido configurada.")
+            else:
+                await update.message.reply_text("✅ Comprobación de contenido eliminada.")
+        else:
+            await update.message.reply_text("❌ Servicio no encontrado.")
+    
+    async def handle_import(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Importa en bloque los servicios de un fichero CSV o JSON enviado al bot"""
+        chat_id = update.effective_chat.id
+        document = update.message.document
+        fmt = service_io.detect_format(document.file_name, document.mime_type)
+        if fmt is None:
+            await update.message.reply_text(
+                "❌ Envía un fichero .csv (columnas name,url,check_interval) o .json"
+            )
+            return
+        
+        await update.message.reply_text("📥 Importando servicios...")
+        try:
+            # El fichero pasa a disco si es grande; la importación va en un hilo aparte
+            with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as buffer:
+                telegram_file = await document.get_file()
+                await telegram_file.download_to_memory(buffer)
+                buffer.seek(0)
+                summary = await asyncio.to_thread(
+                    service_io.ServiceImporter(self.db).import_stream, chat_id, buffer, fmt
+                )
+        except Exception as e:
+            print(f"Error importando servicios de {chat_id}: {e}")
+            await update.message.reply_text("❌ No se pudo importar el fichero.")
+            return
+        
+        message = (
+            f"✅ Importados: {summary['imported']}\n"
+            f"🔁 Duplicados: {summary['duplicates']}\n"
+            f"⚠️ Inválidos: {summary['invalid']}"
+        )
+        errors = summary['errors'][:10]
+        if summary['truncated'] and summary['errors'][-1] not in errors:
+            # El aviso de truncado va siempre el último
+            errors.append(summary['errors'][-1])
+        for error in errors:
+            where = f"Fila {error['row']}: " if error['row'] else ''
+            message += f"\n• {where}{error['error']}"
+        await update.message.reply_text(message[:MAX_MESSAGE_LENGTH])
+    
+    async def handle_export(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /exportar [csv|json] - Descarga los servicios del chat"""
+        chat_id = update.effective_chat.id
+        fmt = context.args[0].lower() if context.args else service_io.CSV
+        if fmt not in (service_io.CSV, service_io.JSON):
+            await update.message.reply_text("❌ Uso: /exportar [csv|json]")
+            return
+        
+        def write_export(buffer):
+            for chunk in service_io.export_services(self.db, chat_id, fmt):
+                buffer.write(chunk.encode('utf-8'))
+            buffer.seek(0)
+        
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as buffer:
+            await asyncio.to_thread(write_export, buffer)
+            extension = 'csv' if fmt == service_io.CSV else 'jsonl'
+            await update.message.reply_document(document=buffer, filename=f"servicios.{extension}")
+    
     async def handle_configure_interval(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Configura el intervalo de verificación para un servicio"""
         chat_id = update.effective_chat.id
@@ -163,18 +424,19 @@ class MonitoringBot:
         """Maneja mensajes de texto normales"""
         chat_id = update.effective_chat.id
         user_message = update.message.text
-        session = self.db.get_user_session(chat_id)
+        session = self.conversations.get(chat_id)
         
         if not session:
             await self.show_main_menu(update)
             return
         
         if session.current_action == 'awaiting_service_name':
-            self.db.set_user_action(chat_id, 'awaiting_service_url', user_message)
+            self.conversations.set(chat_id, 'awaiting_service_url', user_message)
             await update.message.reply_text(
                 "👍 Nombre guardado.\n\n"
                 "Ahora envía la **URL** del servicio:\n"
-                "(Ejemplo: https://mi-servicio.com)"
+                "(Ejemplo: https://mi-servicio.com, tcp://db.mi-servicio.com:5432, "
+                "dns://mi-servicio.com o tls://mi-servicio.com)"
             )
         
         elif session.current_action == 'awaiting_service_url':
@@ -185,7 +447,8 @@ class MonitoringBot:
             if not self.is_valid_url(url):
                 await update.message.reply_text(
                     "❌ URL inválida. Por favor, envía una URL válida:\n"
-                    "(Ejemplo: https://mi-servicio.com)"
+                    "(Ejemplo: https://mi-servicio.com, tcp://db.mi-servicio.com:5432, "
+                "dns://mi-servicio.com o tls://mi-servicio.com)"
                 )
                 return
             
@@ -198,7 +461,7 @@ class MonitoringBot:
                     check_interval=300  # 5 minutos por defecto
                 )
                 
-                self.db.clear_user_session(chat_id)
+                self.conversations.clear(chat_id)
                 
                 await update.message.reply_text(
                     f"✅ **Servicio agregado exitosamente!**\n\n"
@@ -229,7 +492,7 @@ class MonitoringBot:
                 success = self.db.update_service_interval(service_id, chat_id, interval_seconds)
                 
                 if success:
-                    self.db.clear_user_session(chat_id)
+                    self.conversations.clear(chat_id)
                     await update.message.reply_text(
                         f"✅ Intervalo actualizado a {interval_minutes} minutos."
                     )
@@ -253,7 +516,7 @@ class MonitoringBot:
         
         if data.startswith('config_'):
             service_id = int(data.split('_')[1])
-            self.db.set_user_action(chat_id, 'awaiting_interval', str(service_id))
+            self.conversations.set(chat_id, 'awaiting_interval', str(service_id))
             
             await query.edit_message_text(
                 "⏰ **Configurar Intervalo**\n\n"
@@ -286,19 +549,15 @@ class MonitoringBot:
     
     def is_valid_url(self, url):
         """Valida si una URL tiene formato válido"""
-        regex = re.compile(
-            r'^(?:http|ftp)s?://'  # http:// or https://
-            r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain...
-            r'localhost|'  # localhost...
-            r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # ...or ip
-            r'(?::\d+)?'  # optional port
-            r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-        return re.match(regex, url) is not None
+        return service_io.is_valid_url(url)
     
     def setup_handlers(self):
         """Configura todos los manejadores del bot"""
         # Comandos
         self.application.add_handler(CommandHandler("start", self.start))
+        self.application.add_handler(CommandHandler("estadisticas", self.handle_stats))
+        self.application.add_handler(CommandHandler("contenido", self.handle_content_assertion))
+        self.application.add_handler(CommandHandler("exportar", self.handle_export))
         
         # Handlers para botones del teclado
         self.application.add_handler(MessageHandler(filters.Text("➕ Agregar Servicio"), self.handle_add_service))
@@ -311,11 +570,148 @@ class MonitoringBot:
         # Handler para callbacks de botones inline
         self.application.add_handler(CallbackQueryHandler(self.handle_callback_query))
         
+        # Ficheros para la importación masiva
+        self.application.add_handler(MessageHandler(filters.Document.ALL, self.handle_import))
+        
         # Handler para mensajes de texto
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
     
+    async def post_init(self, application: Application):
+        """Arranca la cola de notificaciones en el event loop del bot"""
+        await self.notifier.start(application.bot)
+    
+    async def post_stop(self, application: Application):
+        await self.notifier.stop()
+    
+    @property
+    def webhook_secret(self):
+        """Token que Telegram envía en la cabecera X-Telegram-Bot-Api-Secret-Token.
+        
+        Si no se configura se deriva del token del bot, así todos los procesos
+        lo conocen sin compartir estado.
+        """
+        if Config.WEBHOOK_SECRET_TOKEN:
+            return Config.WEBHOOK_SECRET_TOKEN
+        return hashlib.sha256(f"webhook:{Config.TELEGRAM_BOT_TOKEN}".encode()).hexdigest()
+    
+    @property
+    def running(self):
+        """Si el bot está en marcha en este proceso (es decir, es el líder)"""
+        return self._loop is not None and self.application is not None and self.application.running
+    
+    def submit_update(self, payload):
+        """Entrega un update recibido por webhook al event loop del bot.
+        
+        Se puede llamar desde cualquier hilo (p. ej. el de la petición de
+        Flask) y vuelve enseguida, sin esperar a que el update se procese.
+        Devuelve False si el bot no está en marcha en este proceso o tiene
+        demasiados updates pendientes; lanza ValueError si el payload no es
+        un update válido.
+        """
+        loop, application = self._loop, self.application
+        if loop is None or application is None or not application.running:
+            return False
+        if application.update_queue.qsize() >= Config.WEBHOOK_MAX_PENDING:
+            return False
+        try:
+            update = Update.de_json(payload, application.bot)
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Update no válido: {e}")
+        if update is None:
+            raise ValueError("Update vacío")
+        try:
+            loop.call_soon_threadsafe(application.update_queue.put_nowait, update)
+        except RuntimeError:
+            # El event loop se acaba de cerrar
+            return False
+        return True
+    
+    async def serve_webhook(self):
+        """Arranca la aplicación sin updater y registra el webhook hasta que se pida parar"""
+        application = self.application
+        self._stop_requested = asyncio.Event()
+        await application.initialize()
+        await self.post_init(application)
+        await application.start()
+        try:
+            await application.bot.set_webhook(
+                url=Config.WEBHOOK_URL,
+                secret_token=self.webhook_secret,
+                max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES
+            )
+            print(f"🪝 Webhook registrado en {Config.WEBHOOK_URL}")
+            relay = asyncio.create_task(self._relay_webhook_updates())
+            try:
+                await self._stop_requested.wait()
+            finally:
+                relay.cancel()
+        finally:
+            # El webhook no se borra: el próximo líder lo vuelve a registrar
+            await application.stop()
+            await self.post_stop(application)
+            await application.shutdown()
+    
+    async def _relay_webhook_updates(self):
+        """Procesa los updates que otros workers de gunicorn recibieron por webhook"""
+        application = self.application
+        while not self._stop_requested.is_set():
+            try:
+                payloads = await asyncio.to_thread(self.db.pop_webhook_updates)
+            except Exception as e:
+                print(f"Error leyendo los updates encolados por otros workers: {e}")
+                payloads = []
+            for payload in payloads:
+                try:
+                    update = Update.de_json(json.loads(payload), application.bot)
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    print(f"Update encolado no válido: {e}")
+                    continue
+                if update is not None:
+                    await application.update_queue.put(update)
+            if not payloads:
+                try:
+                    await asyncio.wait_for(self._stop_requested.wait(), Config.WEBHOOK_RELAY_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+    
     def run(self):
-        """Inicia el bot"""
-        self.application = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
+        """Inicia el bot (polling, o webhook si está configurado WEBHOOK_URL)"""
+        # Se ejecuta en un hilo secundario: necesita su propio event loop y no puede instalar señales
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        builder = (
+            Application.builder()
+            .token(Config.TELEGRAM_BOT_TOKEN)
+            .concurrent_updates(Config.BOT_CONCURRENT_UPDATES)
+            .post_init(self.post_init)
+            .post_stop(self.post_stop)
+        )
+        if Config.TELEGRAM_API_URL:
+            builder = builder.base_url(Config.TELEGRAM_API_URL)
+        if Config.WEBHOOK_URL:
+            # Los updates llegan por la ruta /webhook de Flask (ver submit_update)
+            builder = builder.updater(None)
+        self.application = builder.build()
         self.setup_handlers()
-        self.application.run_polling()
\ No newline at end of file
+        try:
+            if Config.WEBHOOK_URL:
+                self._loop.run_until_complete(self.serve_webhook())
+            else:
+                self.application.run_polling(stop_signals=None)
+        finally:
+            self.application = None
+            self._stop_requested = None
+            if not self._loop.is_closed():
+                self._loop.close()
+            self._loop = None
+    
+    def stop(self):
+        """Detiene el bot desde otro hilo (p. ej. al perder el liderazgo)"""
+        loop, application = self._loop, self.application
+        if loop is None or application is None:
+            return
+        if self._stop_requested is not None:
+            loop.call_soon_threadsafe(self._stop_requested.set)
+        else:
+            loop.call_soon_threadsafe(application.stop_running)
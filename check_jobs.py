@@ -0,0 +1,194 @@
+import hashlib
+import json
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+
+
+def scope_key(chat_id, service_ids):
+    """Clave del alcance de un job (chat y/o ids de servicio)"""
+    key = json.dumps([chat_id, sorted(service_ids) if service_ids else None])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class CheckJobManager:
+    """Verificaciones inmediatas en segundo plano, compartidas por todos los workers.
+
+    El estado y los resultados de cada job viven en la base de datos, así
+    que cualquier worker puede consultarlo o emitir sus resultados, y una
+    petición para el mismo alcance que un job en curso (lanzado por
+    cualquier worker) se une a él en lugar de lanzar otro barrido.
+
+    El worker que crea el job lo ejecuta en un pool de
+    `Config.CHECK_JOB_WORKERS` hilos; los resultados se escriben en lotes
+    desde un único hilo a medida que llegan. Solo si `owns_state()` (el
+    proceso que ejecuta las verificaciones programadas) el job actualiza
+    también el estado de los destinos, las alertas y la planificación; en
+    el resto de procesos únicamente verifica y guarda los resultados del job.
+    """
+
+    def __init__(self, monitor, owns_state=lambda: True):
+        self.monitor = monitor
+        self.owns_state = owns_state
+        self.db = monitor.db
+        self._executor = ThreadPoolExecutor(max_workers=Config.CHECK_JOB_WORKERS, thread_name_prefix='check-job')
+        self._pending = queue.Queue()  # (job_id, resultado, None) o (job_id, None, error) al terminar
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def start(self, chat_id=None, service_ids=None, notifier=None):
+        """Devuelve (job_id, joined): el job en curso para el alcance o uno nuevo"""
+        chat_id = str(chat_id) if chat_id else None
+        service_ids = sorted(service_ids) if service_ids else None
+        now = time.time()
+        self.db.expire_stale_check_jobs(now - Config.CHECK_JOB_TIMEOUT_SECONDS, now)
+        job_id, joined = self.db.create_check_job(
+            uuid.uuid4().hex, scope_key(chat_id, service_ids), chat_id,
+            json.dumps(service_ids) if service_ids else None, now
+        )
+        if not joined:
+            self._start_writer()
+            self._executor.submit(self._run, job_id, chat_id, set(service_ids or ()), notifier)
+        return job_id, joined
+
+    def _run(self, job_id, chat_id, service_ids, notifier):
+        error = None
+        try:
+            registry = self.monitor.registry
+            registry.refresh()
+            if chat_id:
+                services = registry.for_chat(chat_id)
+            else:
+                services = [service for target in registry.targets() for service in target.subscribers]
+            if service_ids:
+                services = [service for service in services if service.id in service_ids]
+            wanted = {service.id for service in services}
+            target_ids = {service.target_id for service in services}
+            # Destinos completos: las alertas y el estado siguen siendo de todos sus suscriptores
+            targets = [target for target in registry.targets() if target.id in target_ids]
+            self.db.set_check_job_total(job_id, len(services))
+
+            def on_result(target, outcome):
+                for service in target.subscribers:
+                    if service.id in wanted:
+                        self._pending.put((job_id, {
+                            'service_id': service.id,
+                            'service': service.name,
+                            'url': service.url,
+                            'chat_id': service.chat_id,
+                            'status': outcome.is_up,
+                            'status_code': outcome.status_code,
+                            'latency_ms': outcome.latency_ms,
+                            'error': outcome.error,
+                        }, None))
+
+            if self.owns_state():
+                self.monitor.check_targets(targets, notifier, on_result)
+            else:
+                # El seguimiento de alertas y la planificación de este proceso están vacíos
+                self.monitor.engine.run(targets, lambda index, outcome: on_result(targets[index], outcome))
+        except Exception as e:
+            print(f"Error en la verificación inmediata {job_id}: {e}")
+            error = str(e) or type(e).__name__
+        # Después de todos sus resultados en la cola
+        self._pending.put((job_id, None, error or ''))
+
+    def _start_writer(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='check-job-writer', daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            items = [self._pending.get()]
+            # Agrupar los resultados que lleguen en el mismo intervalo
+            time.sleep(Config.CHECK_JOB_FLUSH_SECONDS)
+            while len(items) < 1000:
+                try:
+                    items.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            results = [
+                (job_id, json.dumps(result, ensure_ascii=False), result['status'])
+                for job_id, result, _ in items if result is not None
+            ]
+            finished = [(job_id, error) for job_id, result, error in items if result is None]
+            try:
+                self.db.add_check_job_results(results)
+            except Exception as e:
+                print(f"Error guardando {len(results)} resultados de verificaciones inmediatas: {e}")
+            for job_id, error in finished:
+                try:
+                    self.db.finish_check_job(job_id, error or None, time.time())
+                except Exception as e:
+                    print(f"Error cerrando la verificación inmediata {job_id}: {e}")
+
+
+def job_summary(job):
+    """Estado de un job (fila de check_jobs) como diccionario"""
+    return {
+        'job_id': job.id,
+        'state': job.state,
+        'chat_id': job.chat_id,
+        'service_ids': json.loads(job.service_ids) if job.service_ids else None,
+        'total': job.total,
+        'completed': job.completed,
+        'up': job.up,
+        'error': job.error,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
+
+
+def iter_job_results(db, job_id, after_id=0):
+    """Resultados (id, payload JSON) de un job desde `after_id` a medida que
+    se guardan, hasta que termina. Produce None cada
+    `Config.CHECK_JOB_KEEPALIVE_SECONDS` sin novedades."""
+    last_yield = time.monotonic()
+    while True:
+        # Primero el estado: si ya había terminado, sus resultados están todos guardados
+        job = db.get_check_job(job_id)
+        rows = db.get_check_job_results(job_id, after_id)
+        for row in rows:
+            yield row.id, row.payload
+            after_id = row.id
+        if rows:
+            last_yield = time.monotonic()
+            continue
+        if job is None or job.state != 'running':
+            return
+        if time.monotonic() - last_yield >= Config.CHECK_JOB_KEEPALIVE_SECONDS:
+            last_yield = time.monotonic()
+            yield None
+        time.sleep(Config.CHECK_JOB_POLL_SECONDS)
+
+
+def sse_events(db, job_id, after_id=0):
+    """Resultados del job como Server-Sent Events (`result` por servicio y
+    `done` al final); el id de cada evento permite reanudar con Last-Event-ID
+    desde cualquier worker"""
+    yield f"event: job\ndata: {json.dumps(job_summary(db.get_check_job(job_id)))}\n\n"
+    for item in iter_job_results(db, job_id, after_id):
+        if item is None:
+            yield ": keep-alive\n\n"
+            continue
+        result_id, payload = item
+        yield f"id: {result_id}\nevent: result\ndata: {payload}\n\n"
+    yield f"event: done\ndata: {json.dumps(job_summary(db.get_check_job(job_id)))}\n\n"
+
+
+def ndjson_events(db, job_id, after_id=0):
+    """Resultados del job como JSON Lines, con el resumen en la primera y la última línea"""
+    yield json.dumps({'event': 'job', **job_summary(db.get_check_job(job_id))}) + '\n'
+    for item in iter_job_results(db, job_id, after_id):
+        if item is None:
+            yield '\n'
+            continue
+        yield json.dumps({'event': 'result', 'id': item[0], **json.loads(item[1])}, ensure_ascii=False) + '\n'
+    yield json.dumps({'event': 'done', **job_summary(db.get_check_job(job_id))}) + '\n'
@@ -5,10 +5,96 @@ load_dotenv()
 
 class Config:
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+    TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')  # servidor de la Bot API propio (por defecto el de Telegram)
     DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///monitored_services.db')
     ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID')
     PORT = int(os.getenv('PORT', 10000))
     
+    # Pool de conexiones a la base de datos (uno por proceso)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 10))  # segundos
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # segundos
+    
+    # Elección de líder: un único proceso ejecuta el scheduler y el bot
+    LEADER_LEASE_SECONDS = int(os.getenv('LEADER_LEASE_SECONDS', 30))
+    
+    # Modo webhook: si se define WEBHOOK_URL, Telegram envía los updates a /webhook en lugar de usar polling
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # p. ej. https://mi-servicio.example.com/webhook
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')  # por defecto se deriva del token del bot
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+    WEBHOOK_MAX_PENDING = 10000  # updates sin procesar antes de responder 503
+    BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', 1))  # updates procesados a la vez
+    WEBHOOK_RELAY_POLL_SECONDS = float(os.getenv('WEBHOOK_RELAY_POLL_SECONDS', 0.25))  # el líder recoge los updates de otros workers
+    
+    # API HTTP (importación, exportación, estadísticas...): sin token, esas rutas no están disponibles
+    API_TOKEN = os.getenv('API_TOKEN')  # se envía como Authorization: Bearer <token>
+    
+    # Modo fragmentado: los servicios se reparten entre procesos worker.py
+    PROBE_SHARDING = os.getenv('PROBE_SHARDING', 'false').lower() in ('1', 'true', 'yes')
+    SHARD_WORKER_TTL = int(os.getenv('SHARD_WORKER_TTL', 30))  # segundos sin latido para dar un worker por caído
+    SHARD_VIRTUAL_NODES = 100  # puntos por worker en el anillo
+    
     # Configuración de monitoreo
     DEFAULT_CHECK_INTERVAL = 300  # 5 minutos en segundos
-    REQUEST_TIMEOUT = 10  # segundos
\ No newline at end of file
+    MIN_CHECK_INTERVAL = 60  # segundos
+    SCHEDULER_TICK_SECONDS = int(os.getenv('SCHEDULER_TICK_SECONDS', 10))
+    SERVICE_CHANGE_OVERLAP_SECONDS = 60  # ventana que se relee del registro de cambios
+    SERVICE_CHANGE_RETENTION_SECONDS = 3600  # después se recarga el registro completo
+    REQUEST_TIMEOUT = 10  # segundos (máximo; ver timeouts adaptativos)
+    ADAPTIVE_TIMEOUT_FACTOR = float(os.getenv('ADAPTIVE_TIMEOUT_FACTOR', 3))  # timeout = p99 de la latencia x factor
+    ADAPTIVE_TIMEOUT_MIN = float(os.getenv('ADAPTIVE_TIMEOUT_MIN', 2))  # segundos
+    ADAPTIVE_TIMEOUT_SAMPLES = 50  # latencias recientes por destino
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))  # fallos seguidos sin respuesta por host
+    CIRCUIT_OPEN_SECONDS = 30  # primera apertura; se duplica en cada reapertura
+    CIRCUIT_MAX_OPEN_SECONDS = int(os.getenv('CIRCUIT_MAX_OPEN_SECONDS', 900))
+    DOWN_BACKOFF_MAX_SECONDS = int(os.getenv('DOWN_BACKOFF_MAX_SECONDS', 1800))  # reverificación máxima de un destino caído
+    MAX_CONCURRENT_PROBES = int(os.getenv('MAX_CONCURRENT_PROBES', 200))
+    MAX_PROBES_PER_HOST = int(os.getenv('MAX_PROBES_PER_HOST', 10))
+    HTTP_KEEPALIVE_PER_HOST = int(os.getenv('HTTP_KEEPALIVE_PER_HOST', 4))  # conexiones persistentes inactivas por origen
+    HTTP_KEEPALIVE_SECONDS = int(os.getenv('HTTP_KEEPALIVE_SECONDS', 90))
+    DNS_CACHE_TTL = int(os.getenv('DNS_CACHE_TTL', 300))  # segundos
+    DNS_CACHE_SIZE = 10000
+    PROBE_MAX_BODY_BYTES = int(os.getenv('PROBE_MAX_BODY_BYTES', 16384))  # cuerpo leído como máximo en un GET
+    PROBE_CAPABILITY_TTL = 86400  # segundos que se recuerda que un host no soporta HEAD
+    TLS_EXPIRY_WARNING_DAYS = int(os.getenv('TLS_EXPIRY_WARNING_DAYS', 14))  # tls:// cae si el certificado caduca antes
+    ASSERTION_MAX_BYTES = int(os.getenv('ASSERTION_MAX_BYTES', 1048576))  # cuerpo leído como máximo para comprobar contenido
+    ASSERTION_WINDOW_BYTES = 65536  # memoria máxima por comprobación en curso
+    ASSERTION_REGEX_MAX_LENGTH = 500  # caracteres de una expresión regular de comprobación
+    ASSERTION_REGEX_TIMEOUT = float(os.getenv('ASSERTION_REGEX_TIMEOUT', 1))  # segundos por búsqueda
+    ASSERTION_REGEX_WORKERS = int(os.getenv('ASSERTION_REGEX_WORKERS', 2))  # procesos que evalúan expresiones regulares
+    
+    # Importación masiva de servicios
+    IMPORT_BATCH_SIZE = 500  # filas insertadas por transacción
+    IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', 50000))
+    
+    # Verificaciones inmediatas (/check-now) en segundo plano
+    CHECK_JOB_WORKERS = int(os.getenv('CHECK_JOB_WORKERS', 2))  # jobs ejecutándose a la vez por proceso
+    CHECK_JOB_RETENTION_SECONDS = int(os.getenv('CHECK_JOB_RETENTION_SECONDS', 300))  # se conservan los terminados
+    CHECK_JOB_TIMEOUT_SECONDS = 600  # un job en curso más antiguo se da por abandonado (worker caído)
+    CHECK_JOB_FLUSH_SECONDS = 0.2  # agrupación de los resultados antes de escribirlos
+    CHECK_JOB_POLL_SECONDS = 0.25  # consulta de resultados nuevos mientras hay un stream abierto
+    CHECK_JOB_KEEPALIVE_SECONDS = 15  # comentario de keep-alive en el stream sin resultados nuevos
+    
+    # Estado de las conversaciones del bot
+    CONVERSATION_CACHE_SIZE = 10000
+    CONVERSATION_TTL_SECONDS = int(os.getenv('CONVERSATION_TTL_SECONDS', 3600))
+    
+    # Confirmación y agrupación de alertas
+    ALERT_CONFIRM_FAILURES = int(os.getenv('ALERT_CONFIRM_FAILURES', 3))
+    ALERT_CONFIRM_SUCCESSES = int(os.getenv('ALERT_CONFIRM_SUCCESSES', 2))
+    ALERT_RECHECK_SECONDS = 20  # reverificación rápida mientras un cambio no está confirmado
+    ALERT_COALESCE_SECONDS = 10  # ventana para agrupar alertas de un mismo chat
+    
+    # Límites de envío de la API de Telegram
+    TELEGRAM_GLOBAL_RATE = 30  # mensajes por segundo
+    TELEGRAM_PER_CHAT_RATE = 1  # mensajes por segundo y chat
+    TELEGRAM_MAX_IN_FLIGHT = 30
+    NOTIFIER_DRAIN_SECONDS = 15  # al detener el bot, tiempo máximo para enviar lo pendiente
+    
+    # Historial de verificaciones
+    HISTORY_RAW_RETENTION_HOURS = int(os.getenv('HISTORY_RAW_RETENTION_HOURS', 48))
+    HISTORY_MINUTE_RETENTION_DAYS = int(os.getenv('HISTORY_MINUTE_RETENTION_DAYS', 14))
+    HISTORY_HOUR_RETENTION_DAYS = int(os.getenv('HISTORY_HOUR_RETENTION_DAYS', 90))
+    HISTORY_DAY_RETENTION_DAYS = int(os.getenv('HISTORY_DAY_RETENTION_DAYS', 730))
+    HISTORY_MAINTENANCE_MINUTES = 5
\ No newline at end of file
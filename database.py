@@ -1,12 +1,29 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from models import Base, MonitoredService, UserSession
-from config import Config
+import time
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import update, delete, text, select, bindparam
+from sqlalchemy.exc import IntegrityError
+import models
+from models import MonitoredService, ProbeTarget, ServiceChange, UserSession, ProbeWorker, AlertOutbox, WebhookUpdate, CheckJob, CheckJobResult
+from targets import normalize_url, target_fingerprint
+from db_pool import pool_stats
+
+# Registro ligero (una tupla) con las columnas que necesita un barrido
+ServiceRecord = namedtuple('ServiceRecord', [
+    'id', 'name', 'url', 'chat_id', 'check_interval', 'last_checked', 'last_status', 'next_check_at',
+    'assertion_type', 'assertion_value', 'target_id'
+])
+
+SWEEP_COLUMNS = [getattr(MonitoredService, field) for field in ServiceRecord._fields]
 
 class DatabaseManager:
     def __init__(self):
-        self.engine = create_engine(Config.DATABASE_URL)
-        self.Session = sessionmaker(bind=self.engine)
+        # Todas las instancias comparten el engine y el pool del proceso
+        self.engine = models.engine
+        self.Session = models.Session
+    
+    def pool_stats(self):
+        return pool_stats(self.engine)
         
     def add_service(self, name, url, chat_id, check_interval=300):
         session = self.Session()
@@ -18,6 +35,8 @@ class DatabaseManager:
                 check_interval=check_interval
             )
             session.add(service)
+            session.flush()
+            self._record_changes(session, [service.id])
             session.commit()
             return service
         except Exception as e:
@@ -36,6 +55,47 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def add_services(self, services):
+        """Inserta en bloque (una transacción) una lista de diccionarios de servicio"""
+        if not services:
+            return 0
+        session = self.Session()
+        try:
+            table = MonitoredService.__table__
+            ids = session.execute(table.insert().returning(table.c.id), services).scalars().all()
+            self._record_changes(session, ids)
+            session.commit()
+            return len(ids)
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def get_service_urls(self, chat_id):
+        """URLs ya monitoreadas por un chat (para descartar duplicados al importar)"""
+        with self.engine.connect() as conn:
+            return set(conn.execute(
+                select(MonitoredService.url).where(MonitoredService.chat_id == str(chat_id))
+            ).scalars())
+    
+    def iter_user_services(self, chat_id, batch_size=1000):
+        """Servicios de un chat como ServiceRecord, paginados por id (sin cargarlos todos)"""
+        last_id = 0
+        while True:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(*SWEEP_COLUMNS)
+                    .where(MonitoredService.chat_id == str(chat_id), MonitoredService.id > last_id)
+                    .order_by(MonitoredService.id)
+                    .limit(batch_size)
+                ).all()
+            for row in rows:
+                yield ServiceRecord(*row)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1].id
+    
     def delete_service(self, service_id, chat_id):
         session = self.Session()
         try:
@@ -45,6 +105,7 @@ class DatabaseManager:
             ).first()
             if service:
                 session.delete(service)
+                self._record_changes(session, [service_id])
                 session.commit()
                 return True
             return False
@@ -63,6 +124,30 @@ class DatabaseManager:
             ).first()
             if service:
                 service.check_interval = new_interval
+                self._record_changes(session, [service_id])
+                session.commit()
+                return True
+            return False
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def update_service_assertion(self, service_id, chat_id, assertion_type, assertion_value):
+        """Configura (o elimina, con assertion_type=None) la comprobación de contenido"""
+        session = self.Session()
+        try:
+            service = session.query(MonitoredService).filter(
+                MonitoredService.id == service_id,
+                MonitoredService.chat_id == str(chat_id)
+            ).first()
+            if service:
+                service.assertion_type = assertion_type
+                service.assertion_value = assertion_value
+                # La comprobación forma parte del destino: se reasigna en el próximo barrido
+                service.target_id = None
+                self._record_changes(session, [service_id])
                 session.commit()
                 return True
             return False
@@ -80,17 +165,213 @@ class DatabaseManager:
         finally:
             session.close()
     
-    def update_service_status(self, service_id, status, last_checked):
+    def _record_changes(self, session, service_ids):
+        # En la misma transacción que el cambio: nunca se publica un cambio que no ocurrió
+        now = time.time()
+        session.execute(ServiceChange.__table__.insert(), [
+            {'service_id': service_id, 'created_at': now} for service_id in service_ids
+        ])
+    
+    def get_service_changes(self, since):
+        """Cambios de servicios registrados desde `since` (timestamp) como (id, service_id, created_at)"""
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(ServiceChange.id, ServiceChange.service_id, ServiceChange.created_at)
+                .where(ServiceChange.created_at >= since)
+                .order_by(ServiceChange.id)
+            ).all()
+    
+    def delete_old_service_changes(self, before):
         session = self.Session()
         try:
-            service = session.query(MonitoredService).filter(
-                MonitoredService.id == service_id
-            ).first()
-            if service:
-                service.last_status = status
-                service.last_checked = last_checked
-                service.is_active = status
+            deleted = session.query(ServiceChange).filter(
+                ServiceChange.created_at < before
+            ).delete(synchronize_session=False)
+            session.commit()
+            return deleted
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def get_services_by_ids(self, service_ids, chunk_size=500):
+        """ServiceRecord de los servicios indicados que todavía existen"""
+        service_ids = list(service_ids)
+        records = []
+        with self.engine.connect() as conn:
+            for start in range(0, len(service_ids), chunk_size):
+                rows = conn.execute(select(*SWEEP_COLUMNS).where(
+                    MonitoredService.id.in_(service_ids[start:start + chunk_size])
+                ))
+                records.extend(ServiceRecord(*row) for row in rows)
+        return records
+    
+    def get_target_statuses(self, target_ids, chunk_size=500):
+        """Último estado guardado de cada destino indicado: {target_id: last_status}"""
+        target_ids = list(target_ids)
+        statuses = {}
+        with self.engine.connect() as conn:
+            for start in range(0, len(target_ids), chunk_size):
+                rows = conn.execute(
+                    select(MonitoredService.target_id, MonitoredService.last_status)
+                    .where(MonitoredService.target_id.in_(target_ids[start:start + chunk_size]))
+                    .distinct()
+                )
+                for target_id, last_status in rows:
+                    # Todos los suscriptores se actualizan juntos; ante la duda, el estado conocido
+                    if statuses.get(target_id) is None:
+                        statuses[target_id] = last_status
+        return statuses
+    
+    def get_sweep_services(self):
+        """Servicios a verificar como ServiceRecord, sin construir objetos ORM"""
+        with self.engine.connect() as conn:
+            return [ServiceRecord(*row) for row in conn.execute(select(*SWEEP_COLUMNS))]
+    
+    def bulk_update_target_status(self, updates):
+        """Aplica en bloque una lista de (target_id, status, last_checked, next_check_at)
+        a todos los servicios suscritos a cada destino (un juego de parámetros por destino)"""
+        if not updates:
+            return
+        session = self.Session()
+        try:
+            if self.engine.dialect.name == 'postgresql':
+                self._bulk_update_values(session, updates, key='target_id')
+            else:
+                # UPDATE por destino en modo executemany (sentencia Core, no por clave primaria)
+                services = MonitoredService.__table__
+                session.execute(
+                    update(services)
+                    .where(services.c.target_id == bindparam('b_target_id'))
+                    .values(
+                        last_status=bindparam('b_status'),
+                        last_checked=bindparam('b_checked'),
+                        is_active=bindparam('b_status'),
+                        next_check_at=bindparam('b_next')
+                    ),
+                    [
+                        {'b_target_id': target_id, 'b_status': status, 'b_checked': last_checked, 'b_next': next_check_at}
+                        for target_id, status, last_checked, next_check_at in updates
+                    ]
+                )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def _bulk_update_values(self, session, updates, key='id', chunk_size=1000):
+        # UPDATE ... FROM (VALUES ...) en una sola sentencia por bloque
+        for start in range(0, len(updates), chunk_size):
+            chunk = updates[start:start + chunk_size]
+            params = {}
+            rows = []
+            for i, (row_id, status, last_checked, next_check_at) in enumerate(chunk):
+                rows.append(f"(:id{i}, :status{i}, :checked{i}, CAST(:next{i} AS TIMESTAMP))")
+                params[f"id{i}"] = row_id
+                params[f"status{i}"] = status
+                params[f"checked{i}"] = last_checked
+                params[f"next{i}"] = next_check_at
+            session.execute(text(
+                "UPDATE services AS s "
+                "SET last_status = v.status, is_active = v.status, last_checked = v.checked, "
+                "next_check_at = v.next "
+                f"FROM (VALUES {', '.join(rows)}) AS v(id, status, checked, next) "
+                f"WHERE s.{key} = v.id"
+            ), params)
+    
+    def assign_targets(self, services, chunk_size=500):
+        """Asigna a cada servicio su destino compartido, creándolo si no existe.
+        
+        Devuelve {service_id: target_id}. Es seguro ejecutarlo a la vez en
+        varios procesos: la huella del destino es única.
+        """
+        assigned = {}
+        for start in range(0, len(services), chunk_size):
+            chunk = services[start:start + chunk_size]
+            keys = {
+                service.id: target_fingerprint(service.url, service.assertion_type, service.assertion_value)
+                for service in chunk
+            }
+            targets = self._get_or_create_targets(chunk, keys)
+            session = self.Session()
+            try:
+                session.execute(update(MonitoredService), [
+                    {'id': service_id, 'target_id': targets[fingerprint]}
+                    for service_id, fingerprint in keys.items()
+                ])
                 session.commit()
+            except Exception as e:
+                session.rollback()
+                raise e
+            finally:
+                session.close()
+            assigned.update({service_id: targets[fingerprint] for service_id, fingerprint in keys.items()})
+        return assigned
+    
+    def _get_or_create_targets(self, services, keys):
+        def existing():
+            with self.engine.connect() as conn:
+                return dict(conn.execute(
+                    select(ProbeTarget.fingerprint, ProbeTarget.id)
+                    .where(ProbeTarget.fingerprint.in_(set(keys.values())))
+                ).all())
+        
+        targets = existing()
+        missing = {}
+        for service in services:
+            fingerprint = keys[service.id]
+            if fingerprint not in targets and fingerprint not in missing:
+                missing[fingerprint] = {
+                    'fingerprint': fingerprint,
+                    'url': normalize_url(service.url),
+                    'assertion_type': service.assertion_type,
+                    'assertion_value': service.assertion_value,
+                }
+        if not missing:
+            return targets
+        
+        session = self.Session()
+        try:
+            session.execute(ProbeTarget.__table__.insert(), list(missing.values()))
+            session.commit()
+        except IntegrityError:
+            # Otro proceso creó alguno de los destinos a la vez: se leen los suyos
+            session.rollback()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+        
+        targets = existing()
+        if len(targets) < len(set(keys.values())):
+            # Inserción concurrente parcial: crear uno a uno los que aún faltan
+            for fingerprint, row in missing.items():
+                if fingerprint in targets:
+                    continue
+                session = self.Session()
+                try:
+                    session.execute(ProbeTarget.__table__.insert(), [row])
+                    session.commit()
+                except IntegrityError:
+                    session.rollback()
+                finally:
+                    session.close()
+            targets = existing()
+        return targets
+    
+    def delete_orphan_targets(self):
+        """Borra los destinos que ya no tienen ningún servicio suscrito"""
+        session = self.Session()
+        try:
+            deleted = session.execute(delete(ProbeTarget).where(
+                ~select(MonitoredService.id).where(MonitoredService.target_id == ProbeTarget.id).exists()
+            )).rowcount
+            session.commit()
+            return deleted
         except Exception as e:
             session.rollback()
             raise e
@@ -110,6 +391,7 @@ class DatabaseManager:
             
             session_obj.current_action = action
             session_obj.temp_data = temp_data
+            session_obj.updated_at = datetime.now()
             session.commit()
         except Exception as e:
             session.rollback()
@@ -140,4 +422,256 @@ class DatabaseManager:
             session.rollback()
             raise e
         finally:
-            session.close()
\ No newline at end of file
+            session.close()
+    
+    def delete_stale_user_sessions(self, older_than):
+        """Elimina las conversaciones sin actividad desde `older_than`"""
+        session = self.Session()
+        try:
+            deleted = session.query(UserSession).filter(
+                UserSession.updated_at < older_than
+            ).delete(synchronize_session=False)
+            session.commit()
+            return deleted
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def heartbeat_worker(self, worker_id, now):
+        """Registra o renueva el latido de un worker de verificación"""
+        session = self.Session()
+        try:
+            updated = session.query(ProbeWorker).filter(
+                ProbeWorker.worker_id == worker_id
+            ).update({'heartbeat_at': now}, synchronize_session=False)
+            if not updated:
+                session.add(ProbeWorker(worker_id=worker_id, heartbeat_at=now, started_at=now))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def remove_worker(self, worker_id):
+        session = self.Session()
+        try:
+            session.query(ProbeWorker).filter(
+                ProbeWorker.worker_id == worker_id
+            ).delete(synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def get_live_workers(self, since):
+        """Identificadores de los workers con latido posterior a `since`"""
+        session = self.Session()
+        try:
+            return session.execute(
+                select(ProbeWorker.worker_id)
+                .where(ProbeWorker.heartbeat_at >= since)
+                .order_by(ProbeWorker.worker_id)
+            ).scalars().all()
+        finally:
+            session.close()
+    
+    def add_alerts(self, alerts):
+        """Inserta en bloque una lista de (chat_id, payload)"""
+        if not alerts:
+            return
+        session = self.Session()
+        try:
+            session.execute(
+                AlertOutbox.__table__.insert(),
+                [{'chat_id': str(chat_id), 'payload': payload} for chat_id, payload in alerts]
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def pop_alerts(self, limit=1000):
+        """Extrae (y borra) las alertas pendientes más antiguas como (chat_id, payload)"""
+        session = self.Session()
+        try:
+            rows = session.execute(
+                select(AlertOutbox.id, AlertOutbox.chat_id, AlertOutbox.payload)
+                .order_by(AlertOutbox.id)
+                .limit(limit)
+            ).all()
+            if rows:
+                session.query(AlertOutbox).filter(
+                    AlertOutbox.id.in_([row.id for row in rows])
+                ).delete(synchronize_session=False)
+            session.commit()
+            return [(row.chat_id, row.payload) for row in rows]
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def add_webhook_update(self, payload):
+        """Encola un update (JSON) para que lo procese el líder"""
+        session = self.Session()
+        try:
+            session.execute(WebhookUpdate.__table__.insert(), {'payload': payload})
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def pop_webhook_updates(self, limit=500):
+        """Extrae (y borra) los updates encolados más antiguos, en orden de llegada"""
+        session = self.Session()
+        try:
+            rows = session.execute(
+                select(WebhookUpdate.id, WebhookUpdate.payload)
+                .order_by(WebhookUpdate.id)
+                .limit(limit)
+            ).all()
+            if rows:
+                session.query(WebhookUpdate).filter(
+                    WebhookUpdate.id.in_([row.id for row in rows])
+                ).delete(synchronize_session=False)
+            session.commit()
+            return [row.payload for row in rows]
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def create_check_job(self, job_id, scope, chat_id, service_ids, now):
+        """Crea un job para el alcance, o devuelve el que ya está en curso.
+        
+        Devuelve (job_id, joined). La restricción única de running_scope
+        resuelve la carrera entre workers que lo crean a la vez.
+        """
+        for _ in range(3):
+            session = self.Session()
+            try:
+                session.add(CheckJob(
+                    id=job_id, running_scope=scope, chat_id=chat_id, service_ids=service_ids,
+                    state='running', completed=0, up=0, created_at=now
+                ))
+                session.commit()
+                return job_id, False
+            except IntegrityError:
+                session.rollback()
+                running = session.scalar(select(CheckJob.id).where(CheckJob.running_scope == scope))
+                if running is not None:
+                    return running, True
+                # El job en curso acaba de terminar: reintentar la creación
+            except Exception as e:
+                session.rollback()
+                raise e
+            finally:
+                session.close()
+        raise RuntimeError("No se pudo crear el job de verificación")
+    
+    def expire_stale_check_jobs(self, before, now):
+        """Da por abandonados los jobs en curso creados antes de `before` (su worker cayó)"""
+        session = self.Session()
+        try:
+            result = session.execute(
+                update(CheckJob)
+                .where(CheckJob.state == 'running', CheckJob.created_at < before)
+                .values(state='error', error='abandonado', running_scope=None, finished_at=now)
+            )
+            session.commit()
+            return result.rowcount
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def set_check_job_total(self, job_id, total):
+        session = self.Session()
+        try:
+            session.execute(update(CheckJob).where(CheckJob.id == job_id).values(total=total))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def add_check_job_results(self, results):
+        """Inserta en bloque una lista de (job_id, payload, is_up) y actualiza los contadores de cada job"""
+        if not results:
+            return
+        counts = {}
+        for job_id, _, is_up in results:
+            completed, up = counts.get(job_id, (0, 0))
+            counts[job_id] = (completed + 1, up + int(bool(is_up)))
+        session = self.Session()
+        try:
+            session.execute(
+                CheckJobResult.__table__.insert(),
+                [{'job_id': job_id, 'payload': payload} for job_id, payload, _ in results]
+            )
+            for job_id, (completed, up) in counts.items():
+                session.execute(
+                    update(CheckJob).where(CheckJob.id == job_id)
+                    .values(completed=CheckJob.completed + completed, up=CheckJob.up + up)
+                )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def finish_check_job(self, job_id, error, now):
+        session = self.Session()
+        try:
+            session.execute(
+                update(CheckJob).where(CheckJob.id == job_id)
+                .values(state='error' if error else 'done', error=error, running_scope=None, finished_at=now)
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def get_check_job(self, job_id):
+        with self.engine.connect() as conn:
+            return conn.execute(select(CheckJob.__table__).where(CheckJob.id == job_id)).first()
+    
+    def get_check_job_results(self, job_id, after_id=0, limit=500):
+        """Resultados (id, payload) de un job posteriores a `after_id`, en orden de llegada"""
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(CheckJobResult.id, CheckJobResult.payload)
+                .where(CheckJobResult.job_id == job_id, CheckJobResult.id > after_id)
+                .order_by(CheckJobResult.id)
+                .limit(limit)
+            ).all()
+    
+    def delete_old_check_jobs(self, before):
+        """Elimina los jobs terminados antes de `before` y sus resultados"""
+        session = self.Session()
+        try:
+            old_jobs = select(CheckJob.id).where(CheckJob.finished_at < before)
+            session.execute(delete(CheckJobResult).where(CheckJobResult.job_id.in_(old_jobs)))
+            result = session.execute(delete(CheckJob).where(CheckJob.finished_at < before))
+            session.commit()
+            return result.rowcount
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
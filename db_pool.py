@@ -0,0 +1,63 @@
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class PoolMetrics:
+    """Métricas de uso del pool de conexiones a la base de datos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_seconds_total = 0.0
+        self.checkout_seconds_max = 0.0
+        self.exhausted = 0
+
+    def record_checkout(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_seconds_total += seconds
+            self.checkout_seconds_max = max(self.checkout_seconds_max, seconds)
+
+    def record_exhausted(self):
+        with self._lock:
+            self.exhausted += 1
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide la espera de cada checkout y cuenta los agotamientos"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_metrics.record_exhausted()
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - start)
+        return connection
+
+
+def pool_stats(engine):
+    """Estado actual del pool y métricas acumuladas de checkout"""
+    pool = engine.pool
+    stats = {
+        'checkouts': pool_metrics.checkouts,
+        'checkout_ms_avg': round(pool_metrics.checkout_seconds_total / pool_metrics.checkouts * 1000, 3)
+        if pool_metrics.checkouts else None,
+        'checkout_ms_max': round(pool_metrics.checkout_seconds_max * 1000, 3),
+        'exhausted': pool_metrics.exhausted,
+    }
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'idle': pool.checkedin(),
+        })
+    return stats
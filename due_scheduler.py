@@ -0,0 +1,121 @@
+import heapq
+import threading
+import time
+
+from metrics import SCHEDULE_LAG
+from config import Config
+
+
+class DueScheduler:
+    """Planificador de verificaciones por servicio.
+
+    Mantiene una cola de prioridad ordenada por la próxima hora de
+    verificación de cada servicio, de modo que en cada tick solo se
+    verifican los servicios vencidos según su `check_interval`.
+    """
+
+    def __init__(self):
+        self._heap = []  # (next_due, service_id)
+        self._next_due = {}  # service_id -> next_due
+        self._intervals = {}  # service_id -> intervalo en segundos
+        self._services = {}  # service_id -> servicio
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._services)
+
+    def update(self, services, now=None):
+        """Añade o actualiza solo los servicios indicados (sin recorrer el resto)"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            for service in services:
+                self._upsert(service, now)
+
+    def remove(self, service_ids):
+        with self._lock:
+            self._remove(service_ids)
+
+    def _upsert(self, service, now):
+        interval = self.interval_for(service)
+        if service.id not in self._next_due:
+            self._schedule(service.id, self._initial_due(service, interval, now))
+        elif self._intervals[service.id] != interval:
+            # Intervalo modificado: adelantar si el nuevo vence antes
+            due = min(self._next_due[service.id], now + interval)
+            self._schedule(service.id, due)
+
+        self._intervals[service.id] = interval
+        self._services[service.id] = service
+
+    def _remove(self, service_ids):
+        for service_id in list(service_ids):
+            self._services.pop(service_id, None)
+            self._next_due.pop(service_id, None)
+            self._intervals.pop(service_id, None)
+
+    def pop_due(self, now=None):
+        """Devuelve los servicios vencidos y los reprograma para su siguiente ciclo"""
+        with self._lock:
+            return self._pop_due(now if now is not None else time.time())
+
+    def _pop_due(self, now):
+        due_services = []
+
+        while self._heap and self._heap[0][0] <= now:
+            due, service_id = heapq.heappop(self._heap)
+            if self._next_due.get(service_id) != due:
+                continue  # entrada obsoleta
+
+            due_services.append(self._services[service_id])
+            SCHEDULE_LAG.observe(now - due)
+
+            # Mantener la fase del servicio; si vamos con retraso, contar desde ahora
+            next_due = due + self._intervals[service_id]
+            if next_due <= now:
+                next_due = now + self._intervals[service_id]
+            self._schedule(service_id, next_due)
+
+        return due_services
+
+    def recheck(self, service_id, due):
+        """Adelanta la próxima verificación de un servicio (nunca la retrasa)"""
+        with self._lock:
+            if service_id in self._next_due and due < self._next_due[service_id]:
+                self._schedule(service_id, due)
+
+    def postpone(self, service_id, due):
+        """Retrasa la próxima verificación de un servicio (nunca la adelanta)"""
+        with self._lock:
+            if service_id in self._next_due and due > self._next_due[service_id]:
+                self._schedule(service_id, due)
+
+    def due_at(self, service_id):
+        """Próxima verificación programada (timestamp) o None si no está planificado"""
+        with self._lock:
+            return self._next_due.get(service_id)
+
+    @staticmethod
+    def interval_for(service):
+        interval = service.check_interval or Config.DEFAULT_CHECK_INTERVAL
+        return max(interval, Config.MIN_CHECK_INTERVAL)
+
+    def _initial_due(self, service, interval, now):
+        # Retomar la planificación persistida (p. ej. tras un reinicio)
+        if service.next_check_at and service.next_check_at.timestamp() > now:
+            return min(service.next_check_at.timestamp(), now + interval)
+        if service.last_checked:
+            due = service.last_checked.timestamp() + interval
+            if due > now:
+                return due
+
+        # Servicios nuevos o atrasados: repartirlos a lo largo de su intervalo
+        # para no verificarlos todos en la misma ráfaga
+        return now + self._phase(service.id, interval)
+
+    @staticmethod
+    def _phase(service_id, interval):
+        return (service_id * 2654435761) % 2 ** 32 / 2 ** 32 * interval
+
+    def _schedule(self, service_id, due):
+        self._next_due[service_id] = due
+        heapq.heappush(self._heap, (due, service_id))
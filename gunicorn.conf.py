@@ -0,0 +1,29 @@
+# Configuración de gunicorn (se carga automáticamente desde el directorio de trabajo)
+#
+# El maestro crea el esquema al arrancar; cada worker importa app.py por
+# separado y el scheduler y el bot solo se ejecutan en el worker que gane la
+# elección de líder (ver leader.py).
+import os
+
+# Hilos por worker: cada stream de /check-now ocupa uno mientras dura el job,
+# y con workers síncronos bloquearía /webhook y el resto de rutas
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+
+def on_starting(server):
+    # El esquema se crea una sola vez, en el maestro, antes de lanzar los workers
+    from models import engine, init_db
+    init_db()
+    # No heredar conexiones abiertas en los procesos hijos
+    engine.dispose()
+
+
+def post_worker_init(worker):
+    from app import start_background_tasks
+    start_background_tasks(init_schema=False)
+
+
+def worker_exit(server, worker):
+    from app import stop_background_tasks
+    stop_background_tasks()
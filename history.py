@@ -0,0 +1,225 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, delete, select, func
+
+from models import CheckResult, CheckRollup
+from histogram import LatencyHistogram
+from config import Config
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+
+# Filas de origen procesadas por bloque al agregar
+ROLLUP_CHUNK = timedelta(hours=1)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def floor_time(ts, resolution):
+    """Redondea una fecha hacia abajo al inicio de su bucket"""
+    delta = ts - EPOCH
+    seconds = delta.days * 86400 + delta.seconds
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+class Bucket:
+    """Agregado fusionable de un intervalo de verificaciones de un servicio.
+
+    `first_up` y `last_up` permiten contar las caídas (transiciones de
+    activo a inactivo) que ocurren justo en la frontera entre dos buckets.
+    """
+
+    __slots__ = ('start', 'checks', 'up_checks', 'latency_sum', 'latency_max',
+                 'histogram', 'outages', 'first_up', 'last_up')
+
+    def __init__(self, start, checks, up_checks, latency_sum, latency_max,
+                 histogram, outages, first_up, last_up):
+        self.start = start
+        self.checks = checks
+        self.up_checks = up_checks
+        self.latency_sum = latency_sum
+        self.latency_max = latency_max
+        self.histogram = histogram
+        self.outages = outages
+        self.first_up = first_up
+        self.last_up = last_up
+
+    @classmethod
+    def from_check(cls, ts, is_up, latency_ms):
+        histogram = LatencyHistogram()
+        if is_up and latency_ms is not None:
+            histogram.add(latency_ms)
+            latency = latency_ms
+        else:
+            latency = 0
+        return cls(ts, 1, 1 if is_up else 0, latency, latency, histogram, 0, is_up, is_up)
+
+    @classmethod
+    def from_rollup(cls, row):
+        return cls(row.bucket_start, row.checks, row.up_checks, row.latency_sum, row.latency_max,
+                   LatencyHistogram.decode(row.latency_hist), row.outages, row.first_up, row.last_up)
+
+    def extend(self, later):
+        """Añade un bucket posterior en el tiempo"""
+        if self.last_up and not later.first_up:
+            self.outages += 1
+        self.outages += later.outages
+        self.last_up = later.last_up
+        self.checks += later.checks
+        self.up_checks += later.up_checks
+        self.latency_sum += later.latency_sum
+        self.latency_max = max(self.latency_max, later.latency_max)
+        self.histogram.merge(later.histogram)
+        return self
+
+
+class HistoryManager:
+    """Historial de verificaciones con agregados por minuto, hora y día.
+
+    Las verificaciones se insertan en bruto en `check_results`. Un trabajo
+    periódico las agrega en `check_rollups` y expira los datos antiguos,
+    de modo que el tamaño de las tablas queda acotado.
+    """
+
+    def __init__(self, db):
+        self.Session = db.Session
+
+    def record_results(self, rows):
+        """Inserta en bloque dicts con service_id, ts, is_up, latency_ms, status_code y error_class"""
+        if not rows:
+            return
+        session = self.Session()
+        try:
+            session.execute(insert(CheckResult), rows)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def run_maintenance(self, now=None):
+        """Agrega los minutos y horas cerrados y expira los datos antiguos"""
+        now = now or datetime.now()
+        # Margen para no cerrar un minuto cuyas escrituras aún pueden llegar
+        closed = now - timedelta(seconds=MINUTE)
+
+        session = self.Session()
+        try:
+            minutes = self._rollup(session, MINUTE, floor_time(closed, MINUTE), self._raw_rows)
+            hours = self._rollup(session, HOUR, floor_time(closed, HOUR), self._rollup_rows(MINUTE))
+            days = self._rollup(session, DAY, floor_time(closed, DAY), self._rollup_rows(HOUR))
+            expired = self._expire(session, now)
+            session.commit()
+            return {'minute_buckets': minutes, 'hour_buckets': hours, 'day_buckets': days, 'expired_rows': expired}
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def _rollup(self, session, resolution, end, source_rows):
+        start = self._watermark(session, resolution)
+        if start is None:
+            first = self._first_source_ts(session, resolution)
+            if first is None:
+                return 0
+            start = floor_time(first, resolution)
+
+        created = 0
+        while start < end:
+            chunk_end = min(start + max(ROLLUP_CHUNK, timedelta(seconds=resolution)), end)
+            buckets = {}
+            # Las filas llegan ordenadas por (service_id, ts)
+            for service_id, bucket in source_rows(session, start, chunk_end):
+                key = (service_id, floor_time(bucket.start, resolution))
+                current = buckets.get(key)
+                if current is None:
+                    bucket.start = key[1]
+                    buckets[key] = bucket
+                else:
+                    current.extend(bucket)
+
+            if buckets:
+                session.execute(insert(CheckRollup), [
+                    {
+                        'service_id': service_id,
+                        'resolution': resolution,
+                        'bucket_start': bucket.start,
+                        'checks': bucket.checks,
+                        'up_checks': bucket.up_checks,
+                        'latency_sum': bucket.latency_sum,
+                        'latency_max': bucket.latency_max,
+                        'latency_hist': bucket.histogram.encode(),
+                        'outages': bucket.outages,
+                        'first_up': bucket.first_up,
+                        'last_up': bucket.last_up,
+                    }
+                    for (service_id, _), bucket in buckets.items()
+                ])
+                created += len(buckets)
+            start = chunk_end
+
+        return created
+
+    def _watermark(self, session, resolution):
+        last = session.scalar(
+            select(func.max(CheckRollup.bucket_start)).where(CheckRollup.resolution == resolution)
+        )
+        return last + timedelta(seconds=resolution) if last else None
+
+    def _first_source_ts(self, session, resolution):
+        if resolution == MINUTE:
+            return session.scalar(select(func.min(CheckResult.ts)))
+        source = HOUR if resolution == DAY else MINUTE
+        return session.scalar(
+            select(func.min(CheckRollup.bucket_start)).where(CheckRollup.resolution == source)
+        )
+
+    @staticmethod
+    def _raw_rows(session, start, end):
+        rows = session.execute(
+            select(CheckResult.service_id, CheckResult.ts, CheckResult.is_up, CheckResult.latency_ms)
+            .where(CheckResult.ts >= start, CheckResult.ts < end)
+            .order_by(CheckResult.service_id, CheckResult.ts)
+        )
+        for service_id, ts, is_up, latency_ms in rows:
+            yield service_id, Bucket.from_check(ts, is_up, latency_ms)
+
+    @staticmethod
+    def _rollup_rows(resolution):
+        def rows(session, start, end):
+            result = session.execute(
+                select(CheckRollup).where(
+                    CheckRollup.resolution == resolution,
+                    CheckRollup.bucket_start >= start,
+                    CheckRollup.bucket_start < end
+                ).order_by(CheckRollup.service_id, CheckRollup.bucket_start)
+            ).scalars()
+            for row in result:
+                yield row.service_id, Bucket.from_rollup(row)
+        return rows
+
+    def _expire(self, session, now):
+        # Nunca borrar datos que todavía no se han agregado al nivel superior
+        minute_mark = self._watermark(session, MINUTE) or datetime.min
+        hour_mark = self._watermark(session, HOUR) or datetime.min
+        day_mark = self._watermark(session, DAY) or datetime.min
+
+        raw_cutoff = min(now - timedelta(hours=Config.HISTORY_RAW_RETENTION_HOURS), minute_mark)
+        minute_cutoff = min(now - timedelta(days=Config.HISTORY_MINUTE_RETENTION_DAYS), hour_mark)
+        hour_cutoff = min(now - timedelta(days=Config.HISTORY_HOUR_RETENTION_DAYS), day_mark)
+        day_cutoff = now - timedelta(days=Config.HISTORY_DAY_RETENTION_DAYS)
+
+        expired = session.execute(delete(CheckResult).where(CheckResult.ts < raw_cutoff)).rowcount
+        expired += session.execute(delete(CheckRollup).where(
+            CheckRollup.resolution == MINUTE, CheckRollup.bucket_start < minute_cutoff
+        )).rowcount
+        expired += session.execute(delete(CheckRollup).where(
+            CheckRollup.resolution == HOUR, CheckRollup.bucket_start < hour_cutoff
+        )).rowcount
+        expired += session.execute(delete(CheckRollup).where(
+            CheckRollup.resolution == DAY, CheckRollup.bucket_start < day_cutoff
+        )).rowcount
+        return expired
@@ -0,0 +1,185 @@
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+
+from sqlalchemy import text, update
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from models import engine, Session, LeaderLease
+
+
+class LeaderElection:
+    """Elección de líder respaldada por la base de datos.
+
+    Solo el proceso líder ejecuta el scheduler y el polling del bot. En
+    PostgreSQL se usa un advisory lock de sesión sobre una conexión
+    dedicada: si el proceso muere, la conexión se cierra y el lock se
+    libera al instante. En el resto de motores (SQLite) se usa una fila
+    de arrendamiento en `leader_leases` que el líder renueva y que los
+    demás procesos pueden tomar cuando expira.
+    """
+
+    def __init__(self, name, on_elected=None, on_revoked=None, lease_seconds=None):
+        self.name = name
+        self.on_elected = on_elected
+        self.on_revoked = on_revoked
+        self.lease_seconds = lease_seconds or Config.LEADER_LEASE_SECONDS
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+
+        self._use_advisory_lock = engine.dialect.name == 'postgresql'
+        self._lock_key = zlib.crc32(name.encode())
+        self._connection = None  # conexión que mantiene el advisory lock
+        self._valid_until = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def interval(self):
+        """Cada cuánto se renueva el arrendamiento o se intenta adquirirlo"""
+        return self.lease_seconds / 4
+
+    def start(self):
+        """Se presenta a la elección en un hilo propio (idempotente)"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=f'leader-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Abandona la elección y libera el liderazgo para que otro proceso lo tome"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.lease_seconds)
+            self._thread = None
+        if self.is_leader:
+            self._set_leader(False)
+        try:
+            self._release()
+        except Exception as e:
+            print(f"Error liberando el liderazgo '{self.name}': {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                acquired = self._try_acquire()
+                if acquired:
+                    self._valid_until = time.time() + self.lease_seconds
+            except Exception as e:
+                print(f"Error en la elección de líder '{self.name}': {e}")
+                # Sin acceso a la base de datos se conserva el liderazgo mientras
+                # el arrendamiento siga vigente; se cede antes de que otro pueda tomarlo
+                acquired = self.is_leader and time.time() + self.interval < self._valid_until
+
+            if acquired != self.is_leader:
+                self._set_leader(acquired)
+
+            self._stop.wait(self.interval)
+
+    def _set_leader(self, is_leader):
+        self.is_leader = is_leader
+        callback = self.on_elected if is_leader else self.on_revoked
+        print(f"👑 Liderazgo '{self.name}' {'adquirido' if is_leader else 'perdido'} ({self.holder})")
+        if callback:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error en el cambio de liderazgo '{self.name}': {e}")
+
+    def _try_acquire(self):
+        if self._use_advisory_lock:
+            return self._try_advisory_lock()
+        return self._try_lease()
+
+    def _try_advisory_lock(self):
+        if self._connection is not None:
+            # Mientras la conexión siga viva el lock es nuestro
+            try:
+                self._connection.execute(text('SELECT 1'))
+                self._connection.commit()
+                return True
+            except Exception:
+                self._close_connection()
+                raise
+
+        connection = engine.connect()
+        try:
+            acquired = connection.execute(
+                text('SELECT pg_try_advisory_lock(:key)'), {'key': self._lock_key}
+            ).scalar()
+            # El lock es de sesión: cerrar la transacción no lo libera
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+
+        if acquired:
+            self._connection = connection
+        else:
+            connection.close()
+        return bool(acquired)
+
+    def _try_lease(self):
+        now = time.time()
+        session = Session()
+        try:
+            # Renovar el arrendamiento propio o tomar uno expirado
+            result = session.execute(
+                update(LeaderLease)
+                .where(LeaderLease.name == self.name)
+                .where((LeaderLease.holder == self.holder) | (LeaderLease.expires_at < now))
+                .values(holder=self.holder, expires_at=now + self.lease_seconds)
+            )
+            if result.rowcount:
+                session.commit()
+                return True
+
+            session.add(LeaderLease(name=self.name, holder=self.holder, expires_at=now + self.lease_seconds))
+            try:
+                session.commit()
+                return True
+            except IntegrityError:
+                # Otro proceso tiene el arrendamiento vigente
+                session.rollback()
+                return False
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _release(self):
+        if self._use_advisory_lock:
+            if self._connection is not None:
+                try:
+                    self._connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': self._lock_key})
+                    self._connection.commit()
+                finally:
+                    self._close_connection()
+            return
+
+        session = Session()
+        try:
+            session.execute(
+                update(LeaderLease)
+                .where(LeaderLease.name == self.name)
+                .where(LeaderLease.holder == self.holder)
+                .values(expires_at=0)
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _close_connection(self):
+        try:
+            self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
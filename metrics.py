@@ -0,0 +1,230 @@
+import bisect
+import threading
+import weakref
+
+# Límites (en segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+class _ThreadOwner:
+    """Objeto guardado en el thread-local: se libera cuando el hilo termina"""
+    __slots__ = ('__weakref__',)
+
+
+class _ThreadShards:
+    """Un acumulador por hilo: cada hilo solo escribe el suyo, sin locks.
+
+    El lock solo se toma la primera vez que un hilo usa la métrica; la
+    lectura suma todos los acumuladores (puede ir un incremento por detrás).
+    Cuando un hilo termina, su acumulador se suma al acumulador base y se
+    descarta, para que los hilos de corta vida no dejen acumuladores.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._local = threading.local()
+        self._base = factory()
+        self._shards = {}  # id del acumulador -> acumulador de un hilo vivo
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._factory()
+            owner = self._local.owner = _ThreadOwner()
+            with self._lock:
+                self._shards[id(shard)] = shard
+            finalizer = weakref.finalize(owner, self._retire, shard)
+            finalizer.atexit = False
+            return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            self._shards.pop(id(shard), None)
+            for index, value in enumerate(shard):
+                self._base[index] += value
+
+    def all(self):
+        with self._lock:
+            return [list(self._base)] + list(self._shards.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._shards)
+
+
+class _CounterChild:
+    __slots__ = ('_shards',)
+
+    def __init__(self):
+        self._shards = _ThreadShards(lambda: [0])
+
+    def inc(self, amount=1):
+        self._shards.get()[0] += amount
+
+    def value(self):
+        return sum(shard[0] for shard in self._shards.all())
+
+
+class _HistogramChild:
+    __slots__ = ('_shards', 'buckets')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # [recuentos por cubo..., +Inf, suma]
+        self._shards = _ThreadShards(lambda: [0] * (len(buckets) + 2))
+
+    def observe(self, value):
+        shard = self._shards.get()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self):
+        totals = [0] * (len(self.buckets) + 2)
+        for shard in self._shards.all():
+            for index, value in enumerate(shard):
+                totals[index] += value
+        return totals[:-1], totals[-1]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """Serie para una combinación de etiquetas (cachéala en el camino caliente)"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def _samples(self, values, child):
+        yield f'{self.name}{self._label_text(values)} {child.value()}'
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def _samples(self, values, child):
+        counts, total = child.snapshot()
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            yield f'{self.name}_bucket{self._label_text(values, [("le", bound)])} {cumulative}'
+        yield f'{self.name}_sum{self._label_text(values)} {total}'
+        yield f'{self.name}_count{self._label_text(values)} {cumulative}'
+
+
+class GaugeFunction(_Metric):
+    """Gauge cuyo valor se calcula al exponer las métricas"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        self.function = function
+        super().__init__(name, documentation)
+
+    def _new_child(self):
+        return None
+
+    def _samples(self, values, child):
+        try:
+            yield f'{self.name} {self.function()}'
+        except Exception as e:
+            print(f"Error calculando la métrica {self.name}: {e}")
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def expose(self):
+        """Texto en el formato de exposición de Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def gauge_function(name, documentation, function):
+    return registry.register(GaugeFunction(name, documentation, function))
+
+
+# Métricas del monitor
+SWEEP_DURATION = histogram('monitor_sweep_duration_seconds', 'Duración de cada barrido de verificaciones', buckets=DURATION_BUCKETS)
+SWEEP_SERVICES = counter('monitor_sweep_services_total', 'Servicios verificados en barridos')
+SCHEDULE_LAG = histogram('monitor_schedule_lag_seconds', 'Retraso de cada verificación respecto a su hora prevista', buckets=DURATION_BUCKETS)
+PROBES = counter('probe_total', 'Verificaciones realizadas por tipo y resultado', ['type', 'outcome'])
+PROBE_LATENCY = histogram('probe_latency_seconds', 'Latencia de las verificaciones por tipo y resultado', ['type', 'outcome'])
+PROBE_SHORT_CIRCUITS = counter('probe_short_circuited_total', 'Verificaciones omitidas por circuito abierto')
+DB_WRITE_LATENCY = histogram('db_write_seconds', 'Latencia de las escrituras en bloque', ['operation'])
+
+# Métricas de las notificaciones
+TELEGRAM_SEND_LATENCY = histogram('telegram_send_seconds', 'Latencia de los envíos a la API de Telegram')
+TELEGRAM_SENT = counter('telegram_sent_total', 'Mensajes enviados a Telegram')
+TELEGRAM_ERRORS = counter('telegram_send_errors_total', 'Errores al enviar a Telegram por tipo', ['error'])
@@ -1,9 +1,24 @@
-from sqlalchemy import create_engine, Column, String, Integer, Boolean, DateTime, Text
+from sqlalchemy import create_engine, inspect, text, Column, String, Integer, BigInteger, SmallInteger, Boolean, DateTime, Float, Text, Index
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.sql import func
 from config import Config
+from db_pool import InstrumentedQueuePool
 
-engine = create_engine(Config.DATABASE_URL)
+def engine_options(url):
+    """Opciones del pool para el engine compartido por todo el proceso"""
+    if url.startswith('sqlite') and (':memory:' in url or url.rstrip('/') == 'sqlite:'):
+        return {}
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': Config.DB_POOL_SIZE,
+        'max_overflow': Config.DB_MAX_OVERFLOW,
+        'pool_timeout': Config.DB_POOL_TIMEOUT,
+        'pool_recycle': Config.DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+# Único engine y fábrica de sesiones del proceso (app, bot y monitor)
+engine = create_engine(Config.DATABASE_URL, **engine_options(Config.DATABASE_URL))
 Base = declarative_base()
 Session = sessionmaker(bind=engine)
 
@@ -13,29 +28,169 @@ class MonitoredService(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)
     url = Column(String(500), nullable=False)
-    chat_id = Column(String(100), nullable=False)
+    chat_id = Column(String(100), nullable=False, index=True)
     is_active = Column(Boolean, default=True)
     check_interval = Column(Integer, default=300)  # segundos
     last_checked = Column(DateTime)
     last_status = Column(Boolean)
+    next_check_at = Column(DateTime)
+    assertion_type = Column(String(20))  # contains, regex o json (ver assertions.py)
+    assertion_value = Column(Text)
+    target_id = Column(Integer, index=True)  # destino compartido (ver targets.py)
     created_at = Column(DateTime, default=func.now())
     
     def __repr__(self):
         return f"<Service(name='{self.name}', url='{self.url}', active={self.is_active})>"
 
+class ProbeTarget(Base):
+    """URL normalizada (y comprobación de contenido) que se verifica una sola vez
+    para todos los servicios que la comparten"""
+    __tablename__ = 'probe_targets'
+    
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String(64), nullable=False, unique=True)
+    url = Column(String(500), nullable=False)
+    assertion_type = Column(String(20))
+    assertion_value = Column(Text)
+    created_at = Column(DateTime, default=func.now())
+
+class ServiceChange(Base):
+    """Registro de cambios de servicios para los registros en memoria (ver service_registry.py)"""
+    __tablename__ = 'service_changes'
+    
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    service_id = Column(Integer, nullable=False)
+    created_at = Column(Float, nullable=False, index=True)  # timestamp Unix
+
 class UserSession(Base):
     __tablename__ = 'user_sessions'
     
     id = Column(Integer, primary_key=True)
-    chat_id = Column(String(100), nullable=False)
+    chat_id = Column(String(100), nullable=False, index=True)
     current_action = Column(String(100))
     temp_data = Column(Text)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+class CheckResult(Base):
+    """Resultado en bruto de cada verificación (tabla estrecha, solo inserciones)"""
+    __tablename__ = 'check_results'
+    __table_args__ = (
+        Index('ix_check_results_service_ts', 'service_id', 'ts'),
+        Index('ix_check_results_ts', 'ts'),
+    )
+    
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    service_id = Column(Integer, nullable=False)
+    ts = Column(DateTime, nullable=False)
+    is_up = Column(Boolean, nullable=False)
+    latency_ms = Column(Integer)
+    status_code = Column(SmallInteger)
+    error_class = Column(String(50))
+
+class CheckRollup(Base):
+    """Agregados por minuto, hora y día (resolution en segundos)"""
+    __tablename__ = 'check_rollups'
+    __table_args__ = (
+        Index('ix_check_rollups_resolution_bucket', 'resolution', 'bucket_start'),
+    )
+    
+    service_id = Column(Integer, primary_key=True)
+    resolution = Column(Integer, primary_key=True)  # segundos
+    bucket_start = Column(DateTime, primary_key=True)
+    checks = Column(Integer, nullable=False, default=0)
+    up_checks = Column(Integer, nullable=False, default=0)
+    latency_sum = Column(BigInteger, nullable=False, default=0)  # solo verificaciones exitosas
+    latency_max = Column(Integer, nullable=False, default=0)
+    latency_hist = Column(Text)  # histograma disperso, ver histogram.py
+    outages = Column(Integer, nullable=False, default=0)
+    first_up = Column(Boolean)
+    last_up = Column(Boolean)
+
+class LeaderLease(Base):
+    """Arrendamiento de liderazgo para motores sin advisory locks (ver leader.py)"""
+    __tablename__ = 'leader_leases'
+    
+    name = Column(String(100), primary_key=True)
+    holder = Column(String(255), nullable=False)
+    expires_at = Column(Float, nullable=False)  # timestamp Unix
+
+class ProbeWorker(Base):
+    """Workers de verificación vivos en modo fragmentado (ver sharding.py)"""
+    __tablename__ = 'probe_workers'
+    
+    worker_id = Column(String(255), primary_key=True)
+    heartbeat_at = Column(Float, nullable=False)  # timestamp Unix
+    started_at = Column(Float, nullable=False)
+
+class AlertOutbox(Base):
+    """Cambios de estado detectados por los workers, pendientes de enviar por el líder"""
+    __tablename__ = 'alert_outbox'
+    
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    chat_id = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    created_at = Column(DateTime, default=func.now())
+
+class WebhookUpdate(Base):
+    """Updates de Telegram recibidos por un worker que no es el líder, pendientes de procesar por él"""
+    __tablename__ = 'webhook_updates'
+    
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    payload = Column(Text, nullable=False)  # JSON del update
+    created_at = Column(DateTime, default=func.now())
+
+class CheckJob(Base):
+    """Verificación inmediata (/check-now) compartida por todos los workers"""
+    __tablename__ = 'check_jobs'
+    
+    id = Column(String(32), primary_key=True)
+    running_scope = Column(String(64), unique=True)  # alcance mientras está en curso; NULL al terminar
+    chat_id = Column(String(100))
+    service_ids = Column(Text)  # JSON, o NULL si no se filtra por id
+    state = Column(String(10), nullable=False)  # running, done o error
+    total = Column(Integer)
+    completed = Column(Integer, nullable=False, default=0)
+    up = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(Float, nullable=False)  # timestamp Unix
+    finished_at = Column(Float, index=True)
+
+class CheckJobResult(Base):
+    """Resultado de un servicio en una verificación inmediata, en orden de llegada"""
+    __tablename__ = 'check_job_results'
+    
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    job_id = Column(String(32), nullable=False, index=True)
+    payload = Column(Text, nullable=False)  # JSON
+
+# Llave del advisory lock de Postgres que serializa la creación del esquema
+SCHEMA_LOCK_KEY = 7301
+
 # Crear tablas
 def init_db():
-    Base.metadata.create_all(engine)
+    """Crea las tablas y aplica los cambios de esquema en una transacción.
+    
+    En Postgres un advisory lock hace que, si varios procesos arrancan a la
+    vez (p. ej. varios worker.py), lo apliquen de uno en uno.
+    """
+    with engine.begin() as conn:
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': SCHEMA_LOCK_KEY})
+        Base.metadata.create_all(conn)
+        upgrade_schema(conn)
+
+def upgrade_schema(conn):
+    """Añade a las tablas existentes las columnas e índices nuevos del modelo"""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
 
 if __name__ == '__main__':
     init_db()
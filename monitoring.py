@@ -1,100 +1,276 @@
-import requests
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from database import DatabaseManager
+from probe_engine import ProbeEngine
+from due_scheduler import DueScheduler
+from targets import group_targets
+from service_registry import ServiceRegistry
+from history import HistoryManager
+from alerting import AlertStateTracker, PENDING, CONFIRMED
+from metrics import SWEEP_DURATION, SWEEP_SERVICES, DB_WRITE_LATENCY
 from config import Config
 
 class ServiceMonitor:
     def __init__(self):
         self.db = DatabaseManager()
+        self.engine = ProbeEngine()
+        self.scheduler = DueScheduler()
+        self.registry = ServiceRegistry(self.db)
+        self.history = HistoryManager(self.db)
+        self.alerts = AlertStateTracker()
+        self._down_streaks = {}  # target_id -> verificaciones seguidas con la caída confirmada
+        self._owned = set()  # destinos de este worker en modo fragmentado (ver check_due_services)
         self.timeout = Config.REQUEST_TIMEOUT
     
-    def check_service(self, service):
-        """Verifica el estado de un servicio individual"""
-        try:
-            # Realizar petición HEAD para mayor eficiencia
-            response = requests.head(
-                service.url, 
-                timeout=self.timeout,
-                allow_redirects=True
-            )
-            is_up = response.status_code < 400
-            status_code = response.status_code
-        except requests.exceptions.SSLError:
-            # Si falla SSL, intentar con HTTP
-            try:
-                http_url = service.url.replace('https://', 'http://')
-                response = requests.head(
-                    http_url, 
-                    timeout=self.timeout,
-                    allow_redirects=True
-                )
-                is_up = response.status_code < 400
-                status_code = response.status_code
-            except Exception:
-                is_up = False
-                status_code = 0
-        except Exception:
-            is_up = False
-            status_code = 0
+    def check_all_services(self, notifier=None):
+        """Verifica todos los servicios y envía notificaciones si es necesario"""
+        self.registry.refresh()
+        return self.check_targets(self.registry.targets(), notifier)
+    
+    def check_due_services(self, notifier=None, owns=None):
+        """Verifica solo los destinos cuyo intervalo ha vencido.
         
-        # Actualizar base de datos
-        self.db.update_service_status(service.id, is_up, datetime.now())
+        El registro en memoria solo aplica los cambios de servicios desde el
+        último tick y el planificador solo recibe los destinos afectados. En
+        modo fragmentado `owns(target_id)` descarta los destinos vencidos de
+        otros workers (se reprograman sin verificarlos).
+        """
+        self.sync_registry()
+        due_targets = self.scheduler.pop_due()
+        if owns is not None:
+            due_targets = self._take_ownership(due_targets, owns)
+        if not due_targets:
+            return []
+        return self.check_targets(due_targets, notifier)
+    
+    def _take_ownership(self, targets, owns):
+        """Destinos de este worker; los que acaba de recibir (otro worker cayó
+        o entró) parten del estado guardado ahora en la base de datos.
         
-        return is_up, status_code
+        El registro en memoria no ve los estados que escriben los demás
+        workers, y sembrar el seguimiento de alertas con él repetiría las
+        alertas que el anterior dueño ya envió.
+        """
+        owned = []
+        for target in targets:
+            if owns(target.id):
+                owned.append(target)
+            elif target.id in self._owned:
+                self._owned.discard(target.id)
+                self.alerts.forget([target.id])
+                self._down_streaks.pop(target.id, None)
+        gained = [target.id for target in owned if target.id not in self._owned]
+        if not gained:
+            return owned
+        try:
+            statuses = self.db.get_target_statuses(gained)
+        except Exception as e:
+            # Sin el estado actual no se pueden verificar sin riesgo de alertas repetidas
+            print(f"Error leyendo el estado de los destinos recibidos: {e}")
+            return [target for target in owned if target.id in self._owned]
+        self.alerts.forget(gained)
+        self._owned.update(gained)
+        return [
+            target._replace(last_status=statuses[target.id]) if target.id in statuses else target
+            for target in owned
+        ]
     
-    def check_all_services(self, bot=None):
-        """Verifica todos los servicios y envía notificaciones si es necesario"""
-        services = self.db.get_all_services()
-        results = []
+    def sync_registry(self):
+        """Aplica al planificador los cambios de servicios desde la última llamada"""
+        self.registry.refresh()
+        changed, removed = self.registry.take_changes()
+        if changed:
+            self.scheduler.update(changed)
+        if removed:
+            self.scheduler.remove(removed)
+            self.alerts.retain(self.registry.target_ids())
+            self._owned.difference_update(removed)
+            for target_id in removed:
+                self._down_streaks.pop(target_id, None)
+    
+    def targets_for(self, services):
+        """Agrupa los servicios por destino, asignando primero los que no lo tienen"""
+        missing = [service for service in services if service.target_id is None]
+        if missing:
+            assigned = self.db.assign_targets(missing)
+            services = [
+                service._replace(target_id=assigned[service.id]) if service.target_id is None else service
+                for service in services
+            ]
+        return group_targets(services)
+    
+    def check_services(self, services, notifier=None):
+        """Verifica una lista de servicios, una sola vez por destino"""
+        return self.check_targets(self.targets_for(services), notifier)
+    
+    def check_targets(self, targets, notifier=None, on_result=None):
+        """Verifica una lista de destinos de forma concurrente y reparte cada
+        resultado entre todos sus servicios suscritos.
+        
+        `on_result(target, outcome)` recibe cada resultado en cuanto llega,
+        antes de que termine el barrido (ver check_jobs.py).
+        """
+        sweep_start = time.perf_counter()
+        pool_before = self.engine.pool_stats()
+        report = None
+        if on_result is not None:
+            def report(index, outcome):
+                on_result(targets[index], outcome)
+        try:
+            outcomes = self.engine.run(targets, report)
+        except Exception as e:
+            # Sin resultados reales no se toca estado, planificación, historial ni alertas
+            print(f"Error en el motor de verificación: {e}")
+            return []
+        
+        self._log_pool_usage(pool_before, self.engine.pool_stats())
+        
+        # Las verificaciones que fallaron en el motor se descartan
+        checked = [(target, outcome) for target, outcome in zip(targets, outcomes) if outcome is not None]
+        targets = [target for target, _ in checked]
+        outcomes = [outcome for _, outcome in checked]
         
-        for service in services:
-            try:
-                previous_status = service.last_status
-                current_status, status_code = self.check_service(service)
-                
-                # Enviar notificación si el estado cambió
-                if bot and previous_status is not None and previous_status != current_status:
-                    self.send_status_notification(bot, service, current_status, status_code)
-                
+        checked_at = datetime.now()
+        results = []
+        for target, (current_status, status_code, latency_ms, error) in checked:
+            transition = self.alerts.observe(target.id, current_status, target.last_status)
+            
+            if transition == PENDING:
+                # Cambio sin confirmar: reverificar pronto en lugar de alertar
+                self.scheduler.recheck(target.id, time.time() + Config.ALERT_RECHECK_SECONDS)
+            elif self.alerts.confirmed(target.id) is False:
+                self._back_off(target)
+            else:
+                self._down_streaks.pop(target.id, None)
+            
+            for service in target.subscribers:
+                if transition == CONFIRMED and notifier:
+                    self.send_status_notification(notifier, service, current_status, status_code)
                 results.append({
                     'service': service,
                     'status': current_status,
                     'status_code': status_code
                 })
-                
-            except Exception as e:
-                print(f"Error checking service {service.name}: {e}")
-                results.append({
-                    'service': service,
-                    'status': False,
-                    'status_code': 0,
-                    'error': str(e)
-                })
         
+        save_error = self.save_results(targets, outcomes, checked_at)
+        if save_error:
+            for result in results:
+                result['error'] = save_error
+        
+        SWEEP_DURATION.observe(time.perf_counter() - sweep_start)
+        SWEEP_SERVICES.inc(len(results))
         return results
     
-    def send_status_notification(self, bot, service, current_status, status_code):
-        """Envía notificación de cambio de estado"""
-        chat_id = service.chat_id
+    def save_results(self, targets, outcomes, checked_at=None):
+        """Guarda en bloque el estado y el historial de un conjunto de verificaciones"""
+        checked_at = checked_at or datetime.now()
+        save_error = None
+        # Sin resultado (verificación no terminada o fallida en el motor): no se guarda nada
+        checked = [(target, outcome) for target, outcome in zip(targets, outcomes) if outcome is not None]
+        if not checked:
+            return None
+        targets, outcomes = zip(*checked)
         
-        if current_status:
-            message = (
-                f"✅ **SERVICIO RECUPERADO**\n"
-                f"**Nombre:** {service.name}\n"
-                f"**URL:** {service.url}\n"
-                f"**Código de estado:** {status_code}\n"
-                f"**Hora:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            )
-        else:
-            message = (
-                f"🚨 **SERVICIO CAÍDO**\n"
-                f"**Nombre:** {service.name}\n"
-                f"**URL:** {service.url}\n"
-                f"**Código de estado:** {status_code if status_code else 'N/A'}\n"
-                f"**Hora:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            )
+        # Un juego de parámetros por destino, no por servicio suscrito
+        try:
+            updates = [
+                (target.id, outcome.is_up, checked_at, self._next_check_at(target, checked_at))
+                for target, outcome in zip(targets, outcomes)
+            ]
+            write_start = time.perf_counter()
+            self.db.bulk_update_target_status(updates)
+            DB_WRITE_LATENCY.labels('service_status').observe(time.perf_counter() - write_start)
+        except Exception as e:
+            print(f"Error guardando el estado de {len(targets)} destinos: {e}")
+            save_error = str(e)
         
+        # El historial sigue siendo por servicio: las estadísticas son por chat
         try:
-            bot.send_message(chat_id=chat_id, text=message, parse_mode='Markdown')
+            write_start = time.perf_counter()
+            self.history.record_results([
+                {
+                    'service_id': service.id,
+                    'ts': checked_at,
+                    'is_up': outcome.is_up,
+                    'latency_ms': outcome.latency_ms,
+                    'status_code': outcome.status_code,
+                    'error_class': outcome.error
+                }
+                for target, outcome in zip(targets, outcomes)
+                for service in target.subscribers
+            ])
+            DB_WRITE_LATENCY.labels('check_results').observe(time.perf_counter() - write_start)
         except Exception as e:
-            print(f"Error sending notification to {chat_id}: {e}")
\ No newline at end of file
+            print(f"Error guardando el historial de verificaciones: {e}")
+        
+        return save_error
+    
+    def _back_off(self, target):
+        """Espacia exponencialmente las verificaciones de un destino que sigue caído"""
+        streak = self._down_streaks.get(target.id, 0) + 1
+        self._down_streaks[target.id] = streak
+        interval = DueScheduler.interval_for(target)
+        delay = min(interval * 2 ** streak, max(Config.DOWN_BACKOFF_MAX_SECONDS, interval))
+        self.scheduler.postpone(target.id, time.time() + delay)
+    
+    def _next_check_at(self, target, checked_at):
+        due = self.scheduler.due_at(target.id)
+        if due is not None:
+            return datetime.fromtimestamp(due)
+        return checked_at + timedelta(seconds=DueScheduler.interval_for(target))
+    
+    def _log_pool_usage(self, before, after):
+        requests_sent = after['requests'] - before['requests']
+        if not requests_sent:
+            return
+        reused = after['connections_reused'] - before['connections_reused']
+        dns_hits = after['dns_hits'] - before['dns_hits']
+        dns_lookups = dns_hits + after['dns_misses'] - before['dns_misses']
+        print(
+            f"♻️ Conexiones reutilizadas: {reused}/{requests_sent} peticiones, "
+            f"DNS en caché: {dns_hits}/{dns_lookups}"
+        )
+    
+    def send_status_notification(self, notifier, service, current_status, status_code):
+        """Encola la notificación de cambio de estado, agrupada por chat"""
+        change = (service.name, service.url, current_status, status_code, datetime.now())
+        notifier.enqueue_batched(service.chat_id, change, self.render_status_changes)
+    
+    @staticmethod
+    def render_status_changes(changes):
+        """Mensaje para uno o varios cambios de estado de un mismo chat"""
+        if len(changes) == 1:
+            name, url, current_status, status_code, changed_at = changes[0]
+            if current_status:
+                message = (
+                    f"✅ **SERVICIO RECUPERADO**\n"
+                    f"**Nombre:** {name}\n"
+                    f"**URL:** {url}\n"
+                    f"**Código de estado:** {status_code}\n"
+                    f"**Hora:** {changed_at.strftime('%Y-%m-%d %H:%M:%S')}"
+                )
+            else:
+                message = (
+                    f"🚨 **SERVICIO CAÍDO**\n"
+                    f"**Nombre:** {name}\n"
+                    f"**URL:** {url}\n"
+                    f"**Código de estado:** {status_code if status_code else 'N/A'}\n"
+                    f"**Hora:** {changed_at.strftime('%Y-%m-%d %H:%M:%S')}"
+                )
+            return message, {'parse_mode': 'Markdown'}
+        
+        down = [change for change in changes if not change[2]]
+        up = [change for change in changes if change[2]]
+        message = f"📣 **{len(changes)} CAMBIOS DE ESTADO**\n\n"
+        if down:
+            message += "🚨 **Caídos:**\n"
+            for name, _, _, status_code, _ in down:
+                message += f"• {name} ({status_code if status_code else 'N/A'})\n"
+            message += "\n"
+        if up:
+            message += "✅ **Recuperados:**\n"
+            for name, _, _, status_code, _ in up:
+                message += f"• {name} ({status_code})\n"
+            message += "\n"
+        message += f"**Hora:** {changes[-1][4].strftime('%Y-%m-%d %H:%M:%S')}"
+        return message, {'parse_mode': 'Markdown'}
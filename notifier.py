@@ -0,0 +1,320 @@
+import asyncio
+import heapq
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from telegram.error import RetryAfter, TimedOut, NetworkError, BadRequest
+
+from metrics import TELEGRAM_SEND_LATENCY, TELEGRAM_SENT, TELEGRAM_ERRORS
+from config import Config
+
+# Reintentos ante errores de red transitorios (no cuenta los 429)
+MAX_SEND_ATTEMPTS = 3
+
+
+class TokenBucket:
+    """Cubo de tokens: `rate` mensajes por segundo con ráfagas de `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now):
+        """Segundos hasta que haya un token disponible"""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now, seconds):
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class NotificationDispatcher:
+    """Cola de notificaciones salientes consumida por el event loop del bot.
+
+    `enqueue` puede llamarse desde cualquier hilo (por ejemplo, el del
+    scheduler). El consumidor respeta un límite global y otro por chat
+    de Telegram, conserva el orden de los mensajes de cada chat y
+    reintenta los 429 tras el `retry_after` indicado por la API.
+    """
+
+    def __init__(self, global_rate=None, per_chat_rate=None, max_in_flight=None):
+        self.global_rate = global_rate or Config.TELEGRAM_GLOBAL_RATE
+        self.per_chat_rate = per_chat_rate or Config.TELEGRAM_PER_CHAT_RATE
+        self.max_in_flight = max_in_flight or Config.TELEGRAM_MAX_IN_FLIGHT
+
+        self.bot = None
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        self._lock = threading.Lock()
+        self._backlog = []  # mensajes recibidos antes de arrancar
+
+        self._batches = {}  # chat_id -> (render, elementos agrupados aún sin enviar)
+        self._queues = {}  # chat_id -> deque de mensajes pendientes
+        self._ready = []  # heap (disponible_en, seq, chat_id)
+        self._seq = itertools.count()
+        self._chat_next_allowed = {}  # chat_id -> siguiente envío permitido
+        # Sin ráfagas: envíos espaciados uniformemente a global_rate
+        self._global_bucket = TokenBucket(self.global_rate, 1)
+        self._in_flight = None
+
+        self.pending = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def start(self, bot):
+        """Arranca el consumidor en el event loop actual"""
+        self.bot = bot
+        self._wakeup = asyncio.Event()
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            backlog, self._backlog = self._backlog, []
+        for chat_id, message in backlog:
+            self._put(chat_id, message)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=None):
+        """Envía lo pendiente (como mucho `timeout` segundos) y detiene el consumidor"""
+        timeout = Config.NOTIFIER_DRAIN_SECONDS if timeout is None else timeout
+        if self._task:
+            # No esperar a que venza la ventana de agrupación
+            for chat_id, (render, _) in list(self._batches.items()):
+                self._flush_batch(chat_id, render)
+            deadline = time.monotonic() + timeout
+            while self._queues and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # El loop del bot va a cerrarse: lo que no se pudo enviar se descarta
+        with self._lock:
+            self._loop = None
+            dropped = sum(len(queue) for queue in self._queues.values())
+            dropped += sum(len(items) for _, items in self._batches.values())
+            self.pending -= dropped
+        self._queues.clear()
+        self._batches.clear()
+        self._ready.clear()
+        if dropped:
+            print(f"Notificaciones sin enviar al detener la cola: {dropped}")
+
+    def enqueue(self, chat_id, text, **kwargs):
+        """Añade un mensaje a la cola (seguro entre hilos)"""
+        message = dict(kwargs, text=text)
+        with self._lock:
+            self.pending += 1
+            loop = self._loop
+            if loop is None:
+                self._backlog.append((chat_id, message))
+                return
+        loop.call_soon_threadsafe(self._put, chat_id, message)
+
+    def enqueue_batched(self, chat_id, item, render, delay=None):
+        """Agrupa los elementos de un chat durante `delay` segundos en un único mensaje.
+
+        `render(items)` recibe la lista agrupada y devuelve (text, kwargs).
+        """
+        delay = Config.ALERT_COALESCE_SECONDS if delay is None else delay
+        with self._lock:
+            loop = self._loop
+            if loop is not None:
+                self.pending += 1
+        if loop is None:
+            text, kwargs = render([item])
+            self.enqueue(chat_id, text, **kwargs)
+            return
+        loop.call_soon_threadsafe(self._add_to_batch, chat_id, item, render, delay)
+
+    def stats(self):
+        return {
+            'pending': self.pending,
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+        }
+
+    def _add_to_batch(self, chat_id, item, render, delay):
+        batch = self._batches.get(chat_id)
+        if batch is None:
+            self._batches[chat_id] = (render, [item])
+            self._loop.call_later(delay, self._flush_batch, chat_id, render)
+        else:
+            batch[1].append(item)
+
+    def _flush_batch(self, chat_id, render):
+        batch = self._batches.pop(chat_id, None)
+        if batch is None:
+            return  # ya enviado al detener la cola
+        _, items = batch
+        try:
+            text, kwargs = render(items)
+        except Exception as e:
+            print(f"Error preparing notification for {chat_id}: {e}")
+            with self._lock:
+                self.pending -= len(items)
+            return
+        with self._lock:
+            self.pending -= len(items) - 1
+        self._put(chat_id, dict(kwargs, text=text))
+
+    def _put(self, chat_id, message):
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            # Chat sin mensajes pendientes ni envío en curso: programarlo
+            self._queues[chat_id] = deque([message])
+            self._schedule(chat_id, self._chat_next_allowed.get(chat_id, 0.0))
+        else:
+            queue.append(message)
+
+    def _schedule(self, chat_id, available_at):
+        heapq.heappush(self._ready, (available_at, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            if not self._ready:
+                self._prune_chat_limits()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            wait = max(self._ready[0][0] - now, self._global_bucket.delay(now))
+            if wait > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._in_flight.acquire()
+            _, _, chat_id = heapq.heappop(self._ready)
+            now = time.monotonic()
+            self._global_bucket.consume(now)
+            self._chat_next_allowed[chat_id] = now + 1 / self.per_chat_rate
+            asyncio.create_task(self._deliver(chat_id))
+
+    async def _deliver(self, chat_id):
+        queue = self._queues[chat_id]
+        message = queue[0]
+        next_at = None
+        try:
+            for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+                try:
+                    await self._send(chat_id, message)
+                    self.sent += 1
+                    break
+                except RetryAfter as e:
+                    # Volver a programar el mismo mensaje tras el retry_after
+                    delay = self._seconds(e.retry_after)
+                    self._global_bucket.pause(time.monotonic(), delay)
+                    self.retried += 1
+                    next_at = time.monotonic() + delay
+                    return
+                except BadRequest:
+                    raise
+                except (TimedOut, NetworkError):
+                    if attempt == MAX_SEND_ATTEMPTS:
+                        raise
+                    await asyncio.sleep(attempt)
+        except Exception as e:
+            self.failed += 1
+            print(f"Error sending notification to {chat_id}: {e}")
+        finally:
+            self._in_flight.release()
+            # Si la cola se descartó al detener el dispatcher no queda nada que hacer
+            if self._queues.get(chat_id) is queue:
+                self._advance(chat_id, queue, next_at)
+
+    async def _send(self, chat_id, message):
+        start = time.perf_counter()
+        try:
+            await self.bot.send_message(chat_id=chat_id, **message)
+        except Exception as e:
+            TELEGRAM_ERRORS.labels(type(e).__name__).inc()
+            raise
+        finally:
+            TELEGRAM_SEND_LATENCY.observe(time.perf_counter() - start)
+        TELEGRAM_SENT.inc()
+
+    def _advance(self, chat_id, queue, next_at):
+        if next_at is None:
+            queue.popleft()
+            with self._lock:
+                self.pending -= 1
+            next_at = self._chat_next_allowed.get(chat_id, 0.0)
+        if queue:
+            self._schedule(chat_id, next_at)
+        else:
+            del self._queues[chat_id]
+
+    def _prune_chat_limits(self):
+        now = time.monotonic()
+        for chat_id in [chat for chat, allowed in self._chat_next_allowed.items() if allowed <= now]:
+            del self._chat_next_allowed[chat_id]
+
+    @staticmethod
+    def _seconds(value):
+        if isinstance(value, timedelta):
+            return value.total_seconds()
+        return float(value)
+
+
+class OutboxNotifier:
+    """Sustituto del dispatcher para los workers de verificación (modo fragmentado).
+
+    Los workers no tienen bot de Telegram: guardan los cambios de estado
+    en `alert_outbox` y el proceso líder los envía con su dispatcher,
+    que es el único que conoce los límites de envío.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._buffer = []
+
+    def enqueue_batched(self, chat_id, item, render=None, delay=None):
+        self._buffer.append((chat_id, self.encode(item)))
+
+    def flush(self):
+        """Escribe en una sola operación los cambios acumulados en el barrido"""
+        buffer, self._buffer = self._buffer, []
+        try:
+            self.db.add_alerts(buffer)
+        except Exception as e:
+            # Se conservan para el siguiente barrido, por delante de las nuevas
+            self._buffer = buffer + self._buffer
+            print(f"Error guardando {len(buffer)} alertas en la cola de salida (se reintentará): {e}")
+
+    @staticmethod
+    def encode(change):
+        name, url, current_status, status_code, changed_at = change
+        return json.dumps([name, url, current_status, status_code, changed_at.isoformat()])
+
+    @staticmethod
+    def decode(payload):
+        name, url, current_status, status_code, changed_at = json.loads(payload)
+        return name, url, current_status, status_code, datetime.fromisoformat(changed_at)
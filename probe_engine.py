@@ -0,0 +1,686 @@
+import asyncio
+import contextlib
+import ipaddress
+import socket
+import ssl
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from urllib.parse import urlsplit
+
+import httpcore
+import httpx
+
+from assertions import RegexTimeout, assertion_for
+from metrics import PROBES, PROBE_LATENCY, PROBE_SHORT_CIRCUITS
+from probes import PROBE_TYPES, probe_for, probe_kinds
+from targets import DEFAULT_PORTS
+from config import Config
+
+ProbeResult = namedtuple('ProbeResult', ['is_up', 'status_code', 'latency_ms', 'error'])
+
+# Respuestas a HEAD que pueden deberse al método y no al recurso: se repite con GET
+HEAD_FALLBACK_STATUSES = (400, 404, 405, 501)
+
+# Series de métricas por tipo de verificación y resultado, resueltas una sola vez
+PROBE_SERIES = {
+    (kind, outcome): (PROBES.labels(kind, outcome), PROBE_LATENCY.labels(kind, outcome))
+    for kind in probe_kinds() for outcome in ('up', 'down', 'error')
+}
+
+
+class DnsCache:
+    """Caché LRU de resoluciones DNS con expiración por TTL.
+
+    El resolvedor del sistema no expone el TTL de los registros, así que
+    se usa `Config.DNS_CACHE_TTL` como tiempo de vida de cada entrada. Se
+    guardan todas las direcciones del host, en el orden del resolvedor.
+    """
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl if ttl is not None else Config.DNS_CACHE_TTL
+        self.max_entries = max_entries or Config.DNS_CACHE_SIZE
+        self._entries = OrderedDict()  # (host, port) -> (expires_at, [direcciones])
+        self._pending = {}  # (host, port) -> Future de una resolución en curso
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, host, port):
+        """Direcciones del host, de la caché o del resolvedor del sistema"""
+        if self._is_ip(host):
+            return [host]
+
+        key = (host, port)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        # Una sola resolución en curso por host
+        pending = self._pending.get(key)
+        if pending:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[key] = future
+        try:
+            infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            addresses = list(dict.fromkeys(info[4][0] for info in infos))
+            self._entries[key] = (time.monotonic() + self.ttl, addresses)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            future.set_result(addresses)
+            return addresses
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # evitar el aviso de excepción no recuperada
+            raise
+        finally:
+            del self._pending[key]
+
+    async def connect(self, host, port, connect):
+        """Abre una conexión con `await connect(dirección)` probando las
+        direcciones del host en orden (p. ej. la IPv4 si la IPv6 no es
+        alcanzable). La que funciona pasa a ser la primera; si fallan todas
+        se invalida la entrada y se relanza el último error."""
+        addresses = await self.resolve(host, port)
+        for index, address in enumerate(addresses):
+            try:
+                connection = await connect(address)
+            except Exception:
+                if index == len(addresses) - 1:
+                    self.invalidate(host, port)
+                    raise
+                continue
+            if index:
+                entry = self._entries.get((host, port))
+                if entry and address in entry[1]:
+                    entry[1].remove(address)
+                    entry[1].insert(0, address)
+            return connection
+
+    def invalidate(self, host, port):
+        self._entries.pop((host, port), None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _is_ip(host):
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+
+
+class HostCapabilityCache:
+    """Recuerda por host si responde bien a HEAD o hay que usar GET.
+
+    Las entradas caducan tras `Config.PROBE_CAPABILITY_TTL` para volver a
+    intentar HEAD si el servidor cambia.
+    """
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl or Config.PROBE_CAPABILITY_TTL
+        self.max_entries = max_entries or Config.DNS_CACHE_SIZE
+        self._entries = OrderedDict()  # host -> (expires_at, method)
+
+    def method(self, host):
+        entry = self._entries.get(host)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return 'HEAD'
+
+    def learn(self, host, method):
+        if method == 'HEAD':
+            self._entries.pop(host, None)
+            return
+        self._entries[host] = (time.monotonic() + self.ttl, method)
+        self._entries.move_to_end(host)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class AdaptiveTimeouts:
+    """Timeout por destino a partir de su latencia observada.
+
+    Guarda las últimas `Config.ADAPTIVE_TIMEOUT_SAMPLES` latencias de las
+    verificaciones con respuesta y usa su p99 por `ADAPTIVE_TIMEOUT_FACTOR`,
+    acotado entre `ADAPTIVE_TIMEOUT_MIN` y `REQUEST_TIMEOUT`. Una URL sin
+    muestras suficientes usa las de su host, y si tampoco hay, `REQUEST_TIMEOUT`.
+    """
+
+    MIN_SAMPLES = 10
+
+    def __init__(self, default=None, max_entries=None):
+        self.default = default or Config.REQUEST_TIMEOUT
+        self.max_entries = max_entries or Config.DNS_CACHE_SIZE
+        self._entries = OrderedDict()  # url o host -> [muestras, timeout calculado]
+
+    def timeout(self, url, host):
+        for key in (url, host):
+            timeout = self._timeout(key)
+            if timeout is not None:
+                return timeout
+        return self.default
+
+    def _timeout(self, key):
+        entry = self._entries.get(key)
+        if entry is None or len(entry[0]) < self.MIN_SAMPLES:
+            return None
+        if entry[1] is None:
+            ordered = sorted(entry[0])
+            p99 = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)]
+            entry[1] = min(max(p99 * Config.ADAPTIVE_TIMEOUT_FACTOR, Config.ADAPTIVE_TIMEOUT_MIN), self.default)
+        return entry[1]
+
+    def observe(self, url, host, seconds):
+        for key in (url, host):
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [deque(maxlen=Config.ADAPTIVE_TIMEOUT_SAMPLES), None]
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            entry[0].append(seconds)
+            entry[1] = None
+
+
+class CircuitBreaker:
+    """Circuito por host (y puerto) para no gastar capacidad en hosts que no responden.
+
+    Tras `Config.CIRCUIT_FAILURE_THRESHOLD` verificaciones seguidas sin
+    respuesta (timeout, conexión rechazada, TLS...) el circuito se abre y
+    las verificaciones del host fallan al instante. Pasado el tiempo de
+    apertura se deja pasar una sola verificación de prueba: si responde se
+    cierra, y si no se vuelve a abrir con el doble de tiempo, hasta
+    `CIRCUIT_MAX_OPEN_SECONDS`. Cualquier respuesta HTTP, aunque sea un
+    error, cuenta como que el host está vivo.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or Config.DNS_CACHE_SIZE
+        self._hosts = OrderedDict()  # host -> [fallos seguidos, abierto hasta, aperturas, inicio de la prueba]
+        self.short_circuited = 0
+
+    def allow(self, host, now=None):
+        """Si se puede verificar el host ahora (marca la prueba si está semiabierto)"""
+        state = self._hosts.get(host)
+        if state is None or state[1] == 0:
+            return True
+        now = now if now is not None else time.monotonic()
+        # Semiabierto: una sola prueba a la vez (si se pierde, otra tras dos timeouts)
+        trial_running = state[3] and now - state[3] < Config.REQUEST_TIMEOUT * 2
+        if now < state[1] or trial_running:
+            self.short_circuited += 1
+            return False
+        state[3] = now
+        return True
+
+    def record(self, host, responded, now=None):
+        state = self._hosts.get(host)
+        if responded:
+            if state is not None:
+                del self._hosts[host]
+            return
+        if state is None:
+            state = self._hosts[host] = [0, 0, 0, 0]
+            while len(self._hosts) > self.max_entries:
+                self._hosts.popitem(last=False)
+        state[0] += 1
+        if state[3] or (state[1] == 0 and state[0] >= Config.CIRCUIT_FAILURE_THRESHOLD):
+            now = now if now is not None else time.monotonic()
+            open_seconds = min(Config.CIRCUIT_OPEN_SECONDS * 2 ** state[2], Config.CIRCUIT_MAX_OPEN_SECONDS)
+            state[1] = now + open_seconds
+            state[2] += 1
+            state[3] = 0
+            if state[2] == 1:
+                print(f"⛔ Circuito abierto para {host} tras {state[0]} fallos seguidos")
+
+    def open_count(self, now=None):
+        now = now if now is not None else time.monotonic()
+        return sum(1 for state in list(self._hosts.values()) if state[1] > now)
+
+
+class HostLimits:
+    """Límite de verificaciones simultáneas por host.
+
+    El semáforo de un host solo existe mientras hay verificaciones suyas en
+    curso o esperando, así que el número de entradas no crece con los
+    hosts verificados alguna vez.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._hosts = {}  # host -> [semáforo, verificaciones que lo usan]
+
+    @contextlib.asynccontextmanager
+    async def hold(self, host):
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = self._hosts[host] = [asyncio.Semaphore(self.limit), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._hosts[host]
+
+    def __len__(self):
+        return len(self._hosts)
+
+
+class ValidatorCache:
+    """Últimos ETag / Last-Modified vistos por URL, para peticiones condicionales"""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or Config.DNS_CACHE_SIZE
+        self._entries = OrderedDict()  # url -> cabeceras condicionales
+
+    def headers(self, url):
+        return self._entries.get(url, {})
+
+    def update(self, url, response):
+        headers = {}
+        if 'etag' in response.headers:
+            headers['If-None-Match'] = response.headers['etag']
+        if 'last-modified' in response.headers:
+            headers['If-Modified-Since'] = response.headers['last-modified']
+        if not headers:
+            self._entries.pop(url, None)
+            return
+        self._entries[url] = headers
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class CachingNetworkBackend(httpcore.AsyncNetworkBackend):
+    """Backend de red que resuelve con DnsCache y cuenta las conexiones abiertas"""
+
+    def __init__(self, dns_cache):
+        self._backend = httpcore.AnyIOBackend()
+        self.dns_cache = dns_cache
+        self.connections_opened = 0
+        self.connect_failures = 0
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        try:
+            stream = await self.dns_cache.connect(host, port, lambda address: self._backend.connect_tcp(
+                address, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+            ))
+        except Exception:
+            self.connect_failures += 1
+            raise
+        self.connections_opened += 1
+        return stream
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+class PooledTransport(httpx.AsyncHTTPTransport):
+    """Transporte httpx con pool de conexiones persistentes y caché DNS.
+
+    Recibe el contexto SSL ya creado: cargar los certificados de las CA
+    cuesta decenas de milisegundos y bloquearía el loop del motor.
+    """
+
+    def __init__(self, network_backend, limits, ssl_context):
+        super().__init__(verify=ssl_context, limits=limits)
+        # El SNI y la verificación TLS siguen usando el nombre de host original
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=ssl_context,
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=network_backend,
+        )
+
+
+class PerOriginTransport(httpx.AsyncBaseTransport):
+    """Un pool de conexiones por origen (esquema, host y puerto).
+
+    Con un único pool para todos los hosts, cada petición recorre todas
+    las conexiones y solicitudes en espera del pool, y una verificación
+    puede quedarse esperando a que otro host libere una conexión. Aquí
+    cada origen guarda como mucho `limits.max_keepalive_connections`
+    conexiones inactivas, y los pools sin uso durante más de
+    `keepalive_expiry` se cierran.
+    """
+
+    def __init__(self, network_backend, limits):
+        self.network_backend = network_backend
+        self.limits = limits
+        self._ssl_context = httpx.create_ssl_context()
+        self._pools = OrderedDict()  # (esquema, host, puerto) -> [transporte, último uso]
+        self._next_cleanup = 0
+
+    async def handle_async_request(self, request):
+        key = (request.url.scheme, request.url.host, request.url.port)
+        now = time.monotonic()
+        entry = self._pools.get(key)
+        if entry is None:
+            entry = self._pools[key] = [PooledTransport(self.network_backend, self.limits, self._ssl_context), now]
+        else:
+            entry[1] = now
+            self._pools.move_to_end(key)
+        if now >= self._next_cleanup:
+            await self._close_idle(now)
+        return await entry[0].handle_async_request(request)
+
+    async def _close_idle(self, now):
+        # Los más antiguos primero; el margen cubre las peticiones que aún estén en curso
+        idle_after = self.limits.keepalive_expiry + Config.REQUEST_TIMEOUT
+        self._next_cleanup = now + self.limits.keepalive_expiry
+        while self._pools:
+            key, (transport, last_used) = next(iter(self._pools.items()))
+            if now - last_used < idle_after:
+                break
+            del self._pools[key]
+            await transport.aclose()
+
+    async def aclose(self):
+        pools, self._pools = self._pools, OrderedDict()
+        for transport, _ in pools.values():
+            await transport.aclose()
+
+    def __len__(self):
+        return len(self._pools)
+
+
+class ProbeEngine:
+    """Motor de verificación concurrente basado en asyncio.
+
+    Lanza todas las peticiones de un barrido a la vez, limitadas por un
+    semáforo global y otro por host, de modo que el tiempo total depende
+    de la petición más lenta y no del número de servicios. El cliente HTTP
+    vive en un event loop propio y reutiliza conexiones entre barridos.
+    """
+
+    def __init__(self, max_concurrency=None, per_host_limit=None, timeout=None):
+        self.max_concurrency = max_concurrency or Config.MAX_CONCURRENT_PROBES
+        self.per_host_limit = per_host_limit or Config.MAX_PROBES_PER_HOST
+        self.timeout = timeout or Config.REQUEST_TIMEOUT
+
+        self.dns_cache = DnsCache()
+        self.network_backend = CachingNetworkBackend(self.dns_cache)
+        self.capabilities = HostCapabilityCache()
+        self.validators = ValidatorCache()
+        self.timeouts = AdaptiveTimeouts(self.timeout)
+        self.breakers = CircuitBreaker()
+        self.body_limit = Config.PROBE_MAX_BODY_BYTES
+        self.requests_sent = 0
+        self.get_fallbacks = 0
+        self.not_modified = 0
+
+        self._loop = None
+        self.transport = None
+        self._client = None
+        self._global_limit = None
+        self._host_limits = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Arranca el event loop del motor en un hilo propio (idempotente)"""
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            ready = threading.Event()
+            thread = threading.Thread(target=self._run_loop, args=(ready,), name='probe-engine', daemon=True)
+            thread.start()
+            ready.wait()
+
+    def _run_loop(self, ready):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(self._setup())
+        self._loop = loop
+        ready.set()
+        loop.run_forever()
+
+    async def _setup(self):
+        # Sin límite de conexiones en los pools: la concurrencia ya la limitan los
+        # semáforos, así que ninguna verificación espera una conexión dentro de su plazo
+        limits = httpx.Limits(
+            max_connections=None,
+            max_keepalive_connections=min(Config.HTTP_KEEPALIVE_PER_HOST, self.per_host_limit),
+            keepalive_expiry=Config.HTTP_KEEPALIVE_SECONDS
+        )
+        self.transport = PerOriginTransport(self.network_backend, limits)
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            transport=self.transport,
+            event_hooks={'request': [self._on_request]}
+        )
+        self._global_limit = asyncio.Semaphore(self.max_concurrency)
+        self._host_limits = HostLimits(self.per_host_limit)
+
+    async def _on_request(self, request):
+        self.requests_sent += 1
+
+    def submit(self, coro):
+        """Programa una corrutina en el loop del motor y devuelve un concurrent.futures.Future"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, services, on_result=None):
+        """Verifica una lista de servicios y devuelve un ProbeResult por servicio
+        (None en las verificaciones que fallaron por un error del motor).
+
+        Si se indica `on_result(index, result)`, se llama desde el loop del
+        motor en cuanto termina cada verificación (no debe bloquear).
+        """
+        if not services:
+            return []
+        return self.submit(self.probe_all(services, on_result)).result()
+
+    async def probe_all(self, services, on_result=None):
+        """Verifica todos los servicios de forma concurrente; el fallo de una
+        verificación no afecta a las demás"""
+        async def probe_one(index, service):
+            result = await self.probe(service.url, assertion_for(service))
+            if on_result is not None:
+                on_result(index, result)
+            return result
+        
+        results = await asyncio.gather(
+            *(probe_one(index, service) for index, service in enumerate(services)), return_exceptions=True
+        )
+        failed = [result for result in results if isinstance(result, BaseException)]
+        if failed:
+            print(f"⚠️ {len(failed)} verificaciones fallidas por un error del motor, p. ej. {failed[0]!r}")
+        return [None if isinstance(result, BaseException) else result for result in results]
+
+    async def probe(self, url, assertion=None):
+        """Verifica una URL con el tipo de verificación de su esquema, respetando
+        el circuito del host y los límites global y por host.
+        
+        El plazo empieza al obtener los huecos de los dos límites; los pools
+        HTTP no limitan las conexiones, así que dentro del plazo no se espera
+        a que otra verificación libere una.
+        """
+        probe = probe_for(url)
+        if probe is None:
+            return ProbeResult(False, 0, 0, 'UnsupportedScheme')
+        host = self.host_key(url)
+        if not self.breakers.allow(host):
+            # Host sin respuesta: fallar al instante sin ocupar capacidad
+            PROBE_SHORT_CIRCUITS.inc()
+            return ProbeResult(False, 0, 0, 'CircuitOpen')
+        
+        # Primero el límite por host, para no ocupar un hueco global mientras se espera
+        async with self._host_limits.hold(host):
+            async with self._global_limit:
+                timeout = self.timeouts.timeout(url, host)
+                start = time.perf_counter()
+                try:
+                    # Plazo total de la verificación (incluido el GET tras un HEAD fallido)
+                    is_up, status_code, error, responded = await asyncio.wait_for(
+                        probe.run(self, url, assertion, timeout), timeout
+                    )
+                except asyncio.TimeoutError:
+                    is_up, status_code, error, responded = False, 0, 'TimeoutError', False
+                elapsed = time.perf_counter() - start
+                
+                self.breakers.record(host, responded)
+                if responded:
+                    self.timeouts.observe(url, host, elapsed)
+                # up, down (respuesta incorrecta) o error (sin respuesta), por tipo
+                probes, latency = PROBE_SERIES[probe.kind, 'up' if is_up else 'down' if responded else 'error']
+                probes.inc()
+                latency.observe(elapsed)
+                return ProbeResult(is_up, status_code, int(elapsed * 1000), error)
+
+    async def probe_url(self, client, url, timeout=None):
+        """Verifica una URL y devuelve (is_up, status_code, error).
+
+        Usa HEAD salvo que el host haya demostrado no soportarlo. Si HEAD
+        responde con uno de `HEAD_FALLBACK_STATUSES` se repite con un GET
+        limitado por rango y se recuerda para el host (con 405/501 siempre,
+        con 400/404 si el GET funciona); cualquier otro error, como un 5xx o
+        un 429, es el resultado, sin duplicar el tráfico a un host que ya
+        falla o limita. Los errores TLS cuentan como caída: no se reintenta
+        por HTTP en claro.
+        """
+        host = self.host_key(url)
+        try:
+            if self.capabilities.method(host) == 'HEAD':
+                response = await self._request(client, 'HEAD', url, timeout)
+                if response.status_code < 400:
+                    return True, response.status_code, None
+                if response.status_code not in HEAD_FALLBACK_STATUSES:
+                    return False, response.status_code, None
+                # Muchos servidores responden 405/404/501 a HEAD aunque GET funcione
+                self.get_fallbacks += 1
+                status_code = await self._get(client, url, timeout)
+                if status_code < 400 or response.status_code in (405, 501):
+                    self.capabilities.learn(host, 'GET')
+            else:
+                status_code = await self._get(client, url, timeout)
+            return status_code < 400, status_code, None
+        except Exception as e:
+            if self._is_ssl_error(e):
+                return False, 0, 'SSLError'
+            return False, 0, type(e).__name__
+
+    async def probe_content(self, client, url, assertion, timeout=None):
+        """GET que evalúa la comprobación de contenido a medida que llega el cuerpo.
+
+        La respuesta se cierra en cuanto el resultado está decidido o tras
+        `Config.ASSERTION_MAX_BYTES`; no se usan peticiones condicionales
+        porque un 304 no trae cuerpo que comprobar.
+        """
+        try:
+            async with client.stream('GET', url, timeout=timeout or self.timeout, follow_redirects=True) as response:
+                if response.status_code >= 400:
+                    return False, response.status_code, None
+                matcher = assertion.start()
+                matched = None
+                received = 0
+                try:
+                    async for chunk in response.aiter_bytes():
+                        matched = await matcher.feed(chunk)
+                        received += len(chunk)
+                        if matched is not None or received >= Config.ASSERTION_MAX_BYTES:
+                            break
+                    if matched is None:
+                        matched = await matcher.finish()
+                except RegexTimeout:
+                    # El host respondió: la expresión regular es la que no terminó a tiempo
+                    return False, response.status_code, 'RegexTimeout'
+                return matched, response.status_code, None if matched else 'AssertionFailed'
+        except Exception as e:
+            if self._is_ssl_error(e):
+                return False, 0, 'SSLError'
+            return False, 0, type(e).__name__
+
+    async def _request(self, client, method, url, timeout=None):
+        headers = self.validators.headers(url)
+        response = await client.request(method, url, headers=headers, timeout=timeout or self.timeout, follow_redirects=True)
+        self._record_response(url, response)
+        return response
+
+    async def _get(self, client, url, timeout=None):
+        """GET por rango que deja de leer el cuerpo al alcanzar `body_limit` bytes"""
+        headers = dict(self.validators.headers(url), Range=f'bytes=0-{self.body_limit - 1}')
+        async with client.stream('GET', url, headers=headers, timeout=timeout or self.timeout, follow_redirects=True) as response:
+            self._record_response(url, response)
+            # Leer cuerpos pequeños completos permite reutilizar la conexión
+            received = 0
+            async for chunk in response.aiter_raw():
+                received += len(chunk)
+                if received >= self.body_limit:
+                    break
+            if response.status_code == 416:
+                # Rango no satisfacible (recurso vacío): el servidor responde
+                return 200
+            return response.status_code
+
+    def _record_response(self, url, response):
+        if response.status_code == 304:
+            self.not_modified += 1
+        elif response.status_code < 400:
+            self.validators.update(url, response)
+
+    def pool_stats(self):
+        """Contadores acumulados del pool de conexiones y de la caché DNS"""
+        opened = self.network_backend.connections_opened
+        failed = self.network_backend.connect_failures
+        reused = max(self.requests_sent - opened - failed, 0)
+        lookups = self.dns_cache.hits + self.dns_cache.misses
+        return {
+            'requests': self.requests_sent,
+            'connections_opened': opened,
+            'connections_reused': reused,
+            'connect_failures': failed,
+            'http_pools': len(self.transport) if self.transport is not None else 0,
+            'pool_hit_rate': round(reused / self.requests_sent, 3) if self.requests_sent else None,
+            'dns_hits': self.dns_cache.hits,
+            'dns_misses': self.dns_cache.misses,
+            'dns_hit_rate': round(self.dns_cache.hits / lookups, 3) if lookups else None,
+            'dns_entries': len(self.dns_cache),
+            'get_fallbacks': self.get_fallbacks,
+            'get_only_hosts': len(self.capabilities),
+            'not_modified': self.not_modified,
+            'open_circuits': self.breakers.open_count(),
+            'short_circuited': self.breakers.short_circuited,
+            'tls_cached_certificates': len(PROBE_TYPES['tls'].certificates),
+        }
+
+    @staticmethod
+    def host_key(url):
+        """Clave del circuito y del límite de concurrencia por host: host y
+        puerto ("db.example.com:5432"), para que un puerto caído no corte
+        las verificaciones de otro servicio del mismo host"""
+        parts = urlsplit(url)
+        host = (parts.hostname or '').lower()
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        port = port or DEFAULT_PORTS.get(parts.scheme.lower())
+        return f'{host}:{port}' if port else host
+
+    @staticmethod
+    def _is_ssl_error(exc):
+        while exc is not None:
+            if isinstance(exc, ssl.SSLError):
+                return True
+            exc = exc.__cause__ or exc.__context__
+        return False
@@ -0,0 +1,202 @@
+import asyncio
+import re
+import socket
+import ssl
+import time
+from collections import OrderedDict
+from datetime import date
+from urllib.parse import urlsplit
+
+from config import Config
+
+# X509_V_ERR_CERT_HAS_EXPIRED de OpenSSL
+CERT_HAS_EXPIRED = 10
+
+# Nombre de host o IPv4 de los destinos que no son HTTP (tcp://, dns://, tls://).
+# Admite nombres de una sola etiqueta (postgres, redis, mi_broker), habituales
+# para bases de datos y brokers en redes internas o de contenedores.
+HOST_PATTERN = re.compile(
+    r'^[A-Z0-9](?:[A-Z0-9_-]{0,61}[A-Z0-9])?'
+    r'(?:\.[A-Z0-9](?:[A-Z0-9_-]{0,61}[A-Z0-9])?)*\.?$', re.IGNORECASE)
+
+
+class HttpProbe:
+    """Petición HTTP(S): HEAD/GET o, con comprobación de contenido
+    (palabra clave, regex o JSON), GET que evalúa el cuerpo"""
+    kind = 'http'
+    schemes = ('http', 'https')
+
+    async def run(self, engine, url, assertion, timeout):
+        if assertion is not None:
+            is_up, status_code, error = await engine.probe_content(engine._client, url, assertion, timeout)
+        else:
+            is_up, status_code, error = await engine.probe_url(engine._client, url, timeout)
+        # Cualquier respuesta HTTP, aunque sea un error, significa que el host contesta
+        return is_up, status_code, error, status_code != 0
+
+
+class TcpProbe:
+    """Conexión TCP a host:puerto (tcp://db.example.com:5432), cerrada al establecerse"""
+    kind = 'tcp'
+    schemes = ('tcp',)
+    default_port = None
+
+    async def run(self, engine, url, assertion, timeout):
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port
+        try:
+            _, writer = await engine.dns_cache.connect(
+                host, port, lambda address: asyncio.open_connection(address, port)
+            )
+        except Exception as e:
+            return False, 0, type(e).__name__, False
+        await _close(writer)
+        return True, 0, None, True
+
+
+class DnsProbe:
+    """Resolución del nombre (dns://example.com) con el resolvedor del sistema.
+
+    No usa la caché DNS del motor: lo que se comprueba es precisamente
+    que el nombre siga resolviendo.
+    """
+    kind = 'dns'
+    schemes = ('dns',)
+    default_port = None
+
+    async def run(self, engine, url, assertion, timeout):
+        host = urlsplit(url).hostname
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except socket.gaierror:
+            # El resolvedor contestó que el nombre no existe
+            return False, 0, 'DNSError', True
+        except Exception as e:
+            return False, 0, type(e).__name__, False
+        return bool(infos), 0, None if infos else 'DNSError', True
+
+
+class CertificateCache:
+    """Caducidad de los certificados ya leídos, válida hasta el día siguiente.
+
+    La fecha de caducidad de un certificado no cambia entre verificaciones,
+    así que basta con un handshake al día por host:puerto.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or Config.DNS_CACHE_SIZE
+        self._entries = OrderedDict()  # (host, port) -> (día de la lectura, caduca en epoch)
+        self.hits = 0
+
+    def get(self, host, port):
+        entry = self._entries.get((host, port))
+        if entry is None or entry[0] != date.today():
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, host, port, not_after):
+        self._entries[(host, port)] = (date.today(), not_after)
+        self._entries.move_to_end((host, port))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TlsProbe:
+    """Handshake TLS (tls://example.com[:443]) que lee la caducidad del certificado.
+
+    El destino está caído si el handshake o la verificación del certificado
+    fallan, o si caduca en menos de `Config.TLS_EXPIRY_WARNING_DAYS` días.
+    La caducidad leída se reutiliza hasta el día siguiente sin conectar.
+    """
+    kind = 'tls'
+    schemes = ('tls',)
+    default_port = 443
+
+    def __init__(self):
+        self.certificates = CertificateCache()
+        self._ssl_context = ssl.create_default_context()
+
+    async def run(self, engine, url, assertion, timeout):
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or self.default_port
+        not_after = self.certificates.get(host, port)
+        if not_after is None:
+            try:
+                _, writer = await engine.dns_cache.connect(host, port, lambda address: asyncio.open_connection(
+                    address, port, ssl=self._ssl_context, server_hostname=host
+                ))
+            except ssl.SSLCertVerificationError as e:
+                # La verificación rechaza el certificado caducado antes de poder leerlo
+                if e.verify_code == CERT_HAS_EXPIRED:
+                    return False, 0, 'CertificateExpired', True
+                return False, 0, 'SSLError', True
+            except Exception as e:
+                # Un error TLS es una respuesta del host; uno de conexión, no
+                if engine._is_ssl_error(e):
+                    return False, 0, 'SSLError', True
+                return False, 0, type(e).__name__, False
+            certificate = writer.get_extra_info('peercert')
+            await _close(writer)
+            not_after = ssl.cert_time_to_seconds(certificate['notAfter'])
+            self.certificates.put(host, port, not_after)
+
+        days_left = (not_after - time.time()) / 86400
+        if days_left < 0:
+            return False, 0, 'CertificateExpired', True
+        if days_left < Config.TLS_EXPIRY_WARNING_DAYS:
+            return False, 0, 'CertificateExpiring', True
+        return True, 0, None, True
+
+
+async def _close(writer):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        pass
+
+
+# Registro de tipos de verificación por esquema de URL
+PROBE_TYPES = {}
+
+
+def register_probe(probe):
+    for scheme in probe.schemes:
+        PROBE_TYPES[scheme] = probe
+    return probe
+
+
+for _probe in (HttpProbe(), TcpProbe(), DnsProbe(), TlsProbe()):
+    register_probe(_probe)
+
+
+def probe_for(url):
+    """Tipo de verificación que corresponde al esquema de la URL (None si no hay)"""
+    return PROBE_TYPES.get(url.split(':', 1)[0].lower())
+
+
+def probe_kinds():
+    return sorted({probe.kind for probe in PROBE_TYPES.values()})
+
+
+def is_valid_probe_url(url):
+    """Valida un destino de un tipo que no es HTTP: host (y puerto si hace falta), sin ruta ni consulta"""
+    probe = probe_for(url)
+    if probe is None or probe.kind == 'http':
+        return False
+    parts = urlsplit(url)
+    try:
+        port = parts.port
+    except ValueError:
+        return False
+    if port == 0 or not parts.hostname or not HOST_PATTERN.match(parts.hostname):
+        return False
+    if parts.username or parts.path not in ('', '/') or parts.query or parts.fragment:
+        return False
+    if probe.kind == 'dns':
+        return port is None
+    return port is not None or probe.default_port is not None
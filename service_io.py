@@ -0,0 +1,219 @@
+import csv
+import io
+import json
+import re
+from assertions import build_assertion, ASSERTION_TYPES
+from probes import is_valid_probe_url, probe_for
+from targets import normalize_url
+from config import Config
+
+CSV = 'csv'
+JSON = 'json'
+
+# Columnas de importación y exportación (name y url son obligatorias)
+FIELDS = ('name', 'url', 'check_interval', 'assertion_type', 'assertion_value')
+
+URL_PATTERN = re.compile(
+    r'^https?://'  # http:// or https://
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain...
+    r'localhost|'  # localhost...
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # ...or ip
+    r'(?::\d+)?'  # optional port
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+
+# Errores detallados que se devuelven como máximo en el resumen
+MAX_REPORTED_ERRORS = 20
+
+
+def is_valid_url(url):
+    """Valida si una URL tiene formato válido (http/https, o tcp://, dns:// y tls://)"""
+    return URL_PATTERN.match(url) is not None or is_valid_probe_url(url)
+
+
+def detect_format(filename=None, content_type=None):
+    """Formato (CSV o JSON) a partir del nombre de fichero o del Content-Type"""
+    name = (filename or '').lower()
+    kind = (content_type or '').lower()
+    if name.endswith(('.json', '.jsonl', '.ndjson')) or 'json' in kind:
+        return JSON
+    if name.endswith('.csv') or 'csv' in kind:
+        return CSV
+    return None
+
+
+def iter_csv_rows(text_stream):
+    """Filas de un CSV con cabecera, leídas de una en una"""
+    return csv.DictReader(text_stream)
+
+
+def iter_json_rows(text_stream, chunk_size=65536):
+    """Objetos de un array JSON o de JSON Lines sin cargar el documento completo.
+
+    Solo se mantiene en memoria el objeto que se está decodificando.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        # Saltar separadores entre objetos
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if not started and position < len(buffer):
+            started = True
+            if buffer[position] == '[':
+                position += 1
+                continue
+        if position < len(buffer) and buffer[position] == ']':
+            return
+
+        try:
+            if position >= len(buffer):
+                raise ValueError('buffer vacío')
+            row, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            if eof:
+                if buffer[position:].strip():
+                    raise ValueError("JSON incompleto o mal formado")
+                return
+            # Objeto incompleto: descartar lo ya leído y pedir más texto
+            chunk = text_stream.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        position = end
+        yield row
+
+
+def iter_rows(stream, fmt):
+    """Filas (diccionarios) de un flujo binario en el formato indicado"""
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == CSV:
+        return iter_csv_rows(text_stream)
+    return iter_json_rows(text_stream)
+
+
+def validate_row(row):
+    """Normaliza una fila de importación; lanza ValueError si no es válida"""
+    if not isinstance(row, dict):
+        raise ValueError("la fila no es un objeto")
+    name = str(row.get('name') or '').strip()
+    url = str(row.get('url') or '').strip()
+    if not name:
+        raise ValueError("falta el nombre")
+    if len(name) > 255:
+        raise ValueError("nombre demasiado largo")
+    if not url or len(url) > 500 or not is_valid_url(url):
+        raise ValueError(f"URL inválida: {url[:100]}")
+
+    interval = row.get('check_interval')
+    if interval in (None, ''):
+        interval = Config.DEFAULT_CHECK_INTERVAL
+    try:
+        interval = int(interval)
+    except (TypeError, ValueError):
+        raise ValueError(f"intervalo inválido: {interval}")
+    if interval < Config.MIN_CHECK_INTERVAL:
+        raise ValueError(f"el intervalo mínimo es {Config.MIN_CHECK_INTERVAL} segundos")
+
+    assertion_type = str(row.get('assertion_type') or '').strip() or None
+    assertion_value = str(row.get('assertion_value') or '') or None
+    if assertion_type:
+        if probe_for(url).kind != 'http':
+            raise ValueError("las comprobaciones de contenido solo se aplican a URLs http/https")
+        if assertion_type not in ASSERTION_TYPES:
+            raise ValueError(f"tipo de comprobación desconocido: {assertion_type}")
+        build_assertion(assertion_type, assertion_value)
+    else:
+        assertion_value = None
+
+    return {
+        'name': name,
+        'url': url,
+        'check_interval': interval,
+        'assertion_type': assertion_type,
+        'assertion_value': assertion_value,
+    }
+
+
+class ServiceImporter:
+    """Importación masiva de servicios en una sola pasada.
+
+    Valida y descarta duplicados (por URL normalizada dentro del chat) a
+    medida que lee las filas, y las inserta en lotes de
+    `Config.IMPORT_BATCH_SIZE`, cada uno en su propia transacción. Se leen
+    como mucho `Config.IMPORT_MAX_ROWS` filas; si hay más, el resumen lo
+    indica con `truncated` y un error.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def import_stream(self, chat_id, stream, fmt):
+        return self.import_rows(chat_id, iter_rows(stream, fmt))
+
+    def import_rows(self, chat_id, rows):
+        chat_id = str(chat_id)
+        # Misma URL normalizada = mismo destino (ver targets.normalize_url)
+        seen = {normalize_url(url) for url in self.db.get_service_urls(chat_id)}
+        summary = {'imported': 0, 'duplicates': 0, 'invalid': 0, 'truncated': False, 'errors': []}
+        batch = []
+
+        try:
+            for line, row in enumerate(rows, start=1):
+                if line > Config.IMPORT_MAX_ROWS:
+                    summary['truncated'] = True
+                    summary['errors'].append({
+                        'row': line,
+                        'error': f"se alcanzó el máximo de {Config.IMPORT_MAX_ROWS} filas; el resto no se importó"
+                    })
+                    break
+                try:
+                    service = validate_row(row)
+                except ValueError as e:
+                    summary['invalid'] += 1
+                    if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                        summary['errors'].append({'row': line, 'error': str(e)})
+                    continue
+
+                key = normalize_url(service['url'])
+                if key in seen:
+                    summary['duplicates'] += 1
+                    continue
+                seen.add(key)
+
+                service['chat_id'] = chat_id
+                batch.append(service)
+                if len(batch) >= Config.IMPORT_BATCH_SIZE:
+                    summary['imported'] += self.db.add_services(batch)
+                    batch = []
+        except (ValueError, csv.Error, UnicodeDecodeError) as e:
+            # Fichero mal formado: se conserva lo importado hasta aquí
+            summary['errors'].append({'row': None, 'error': f"fichero no válido: {e}"})
+
+        if batch:
+            summary['imported'] += self.db.add_services(batch)
+        return summary
+
+
+def export_services(db, chat_id, fmt):
+    """Genera la exportación de los servicios de un chat trozo a trozo (CSV o JSON Lines)"""
+    if fmt == CSV:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(FIELDS)
+        for service in db.iter_user_services(chat_id):
+            writer.writerow([getattr(service, field) or '' for field in FIELDS])
+            if buffer.tell() >= 65536:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+
+    for service in db.iter_user_services(chat_id):
+        yield json.dumps({field: getattr(service, field) for field in FIELDS}, ensure_ascii=False) + '\n'
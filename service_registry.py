@@ -0,0 +1,150 @@
+import threading
+import time
+
+from targets import group_targets
+from config import Config
+
+
+class ServiceRegistry:
+    """Registro en memoria de los servicios, residente en el proceso.
+
+    Se carga completo una sola vez y después solo aplica los cambios
+    publicados en `service_changes` por add_service, delete_service,
+    update_service_interval, etc. (de este u otro proceso). Cada consulta
+    relee una ventana de `SERVICE_CHANGE_OVERLAP_SECONDS` para no perder
+    transacciones que confirmaron tarde; los cambios ya aplicados se
+    recuerdan por id.
+
+    Indexa los servicios (ServiceRecord) por id, chat y destino, y mantiene
+    los destinos agrupados. Los destinos modificados se acumulan hasta que
+    el monitor los recoge con `take_changes()` para su planificador.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._services = {}  # service_id -> ServiceRecord
+        self._by_chat = {}  # chat_id -> {service_id}
+        self._by_target = {}  # target_id -> {service_id}
+        self._targets = {}  # target_id -> Target
+        self._applied = {}  # id de cambio -> created_at
+        self._since = None
+        self._last_poll = 0.0
+        self._changed_targets = set()
+        self._removed_targets = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._services)
+
+    def refresh(self, now=None):
+        """Carga el registro la primera vez (o tras mucho tiempo sin consultar)
+        y después aplica solo los cambios nuevos"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            if self._since is None or now - self._last_poll > Config.SERVICE_CHANGE_RETENTION_SECONDS / 2:
+                self._load(now)
+            else:
+                self._poll(now)
+            self._last_poll = now
+
+    def take_changes(self):
+        """Destinos añadidos o modificados y ids de destinos eliminados desde la última llamada"""
+        with self._lock:
+            changed = [self._targets[target_id] for target_id in self._changed_targets if target_id in self._targets]
+            removed = set(self._removed_targets)
+            self._changed_targets.clear()
+            self._removed_targets.clear()
+            return changed, removed
+
+    def targets(self):
+        with self._lock:
+            return list(self._targets.values())
+
+    def target_ids(self):
+        with self._lock:
+            return set(self._targets)
+
+    def for_chat(self, chat_id):
+        """Servicios de un chat, ordenados por id"""
+        with self._lock:
+            return [self._services[service_id] for service_id in sorted(self._by_chat.get(str(chat_id), ()))]
+
+    def _load(self, now):
+        # Los cambios leídos antes de la carga ya están en ella; los posteriores se aplicarán
+        since = now - Config.SERVICE_CHANGE_OVERLAP_SECONDS
+        applied = {change.id: change.created_at for change in self.db.get_service_changes(since)}
+        services = self._with_targets(self.db.get_sweep_services())
+
+        previous = set(self._targets)
+        self._services.clear()
+        self._by_chat.clear()
+        self._by_target.clear()
+        self._targets.clear()
+        self._applied = applied
+        for service in services:
+            self._index(service)
+        self._targets = {target.id: target for target in group_targets(services)}
+
+        self._changed_targets = set(self._targets)
+        self._removed_targets = previous - set(self._targets)
+        self._since = since
+        print(f"📇 Registro de servicios cargado: {len(services)} servicios, {len(self._targets)} destinos")
+
+    def _poll(self, now):
+        changes = [change for change in self.db.get_service_changes(self._since) if change.id not in self._applied]
+        since = now - Config.SERVICE_CHANGE_OVERLAP_SECONDS
+        if changes:
+            service_ids = {change.service_id for change in changes}
+            records = self._with_targets(self.db.get_services_by_ids(service_ids))
+            self._apply(service_ids, records)
+            for change in changes:
+                self._applied[change.id] = change.created_at
+
+        self._applied = {change_id: created_at for change_id, created_at in self._applied.items() if created_at >= since}
+        self._since = since
+
+    def _apply(self, service_ids, records):
+        dirty = set()
+        for service_id in service_ids:
+            old = self._services.get(service_id)
+            if old is not None:
+                self._unindex(old)
+                dirty.add(old.target_id)
+        for service in records:
+            self._index(service)
+            dirty.add(service.target_id)
+
+        for target_id in dirty:
+            subscribers = [self._services[service_id] for service_id in sorted(self._by_target.get(target_id, ()))]
+            if subscribers:
+                self._targets[target_id] = group_targets(subscribers)[0]
+                self._changed_targets.add(target_id)
+                self._removed_targets.discard(target_id)
+            elif self._targets.pop(target_id, None) is not None:
+                self._removed_targets.add(target_id)
+                self._changed_targets.discard(target_id)
+
+    def _with_targets(self, services):
+        """Asigna destino a los servicios que todavía no lo tienen"""
+        missing = [service for service in services if service.target_id is None]
+        if not missing:
+            return services
+        assigned = self.db.assign_targets(missing)
+        return [
+            service._replace(target_id=assigned[service.id]) if service.target_id is None else service
+            for service in services
+        ]
+
+    def _index(self, service):
+        self._services[service.id] = service
+        self._by_chat.setdefault(service.chat_id, set()).add(service.id)
+        self._by_target.setdefault(service.target_id, set()).add(service.id)
+
+    def _unindex(self, service):
+        del self._services[service.id]
+        for index, key in ((self._by_chat, service.chat_id), (self._by_target, service.target_id)):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(service.id)
+                if not ids:
+                    del index[key]
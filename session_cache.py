@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from config import Config
+
+ConversationState = namedtuple('ConversationState', ['current_action', 'temp_data'])
+
+_MISSING = object()
+
+
+class ConversationCache:
+    """Caché LRU con expiración delante de la tabla user_sessions.
+
+    Es de escritura directa: la base de datos solo se toca cuando el
+    estado de la conversación cambia de verdad, y también se recuerda
+    la ausencia de conversación para no consultarla en cada mensaje.
+    Los flujos abandonados expiran tras `CONVERSATION_TTL_SECONDS`.
+    """
+
+    def __init__(self, db, max_entries=None, ttl=None):
+        self.db = db
+        self.max_entries = max_entries or Config.CONVERSATION_CACHE_SIZE
+        self.ttl = ttl or Config.CONVERSATION_TTL_SECONDS
+        self._entries = OrderedDict()  # chat_id -> (estado o None, actualizado_en)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chat_id):
+        """Estado actual de la conversación del chat, o None"""
+        chat_id = str(chat_id)
+        entry = self._lookup(chat_id)
+        if entry is _MISSING:
+            self.misses += 1
+            entry = self._load(chat_id)
+        else:
+            self.hits += 1
+
+        state, updated_at = entry
+        if state is not None and time.time() - updated_at > self.ttl:
+            # Flujo abandonado
+            self.clear(chat_id)
+            return None
+        return state
+
+    def set(self, chat_id, action, temp_data=None):
+        chat_id = str(chat_id)
+        state = ConversationState(action, temp_data)
+        if self.get(chat_id) == state:
+            return
+        self.db.set_user_action(chat_id, action, temp_data)
+        self._store(chat_id, state)
+
+    def clear(self, chat_id):
+        chat_id = str(chat_id)
+        entry = self._lookup(chat_id)
+        if entry is not _MISSING and entry[0] is None:
+            return
+        self.db.clear_user_session(chat_id)
+        self._store(chat_id, None)
+
+    def _load(self, chat_id):
+        session_obj = self.db.get_user_session(chat_id)
+        if session_obj is None:
+            state, updated_at = None, time.time()
+        else:
+            state = ConversationState(session_obj.current_action, session_obj.temp_data)
+            changed = session_obj.updated_at or session_obj.created_at
+            updated_at = changed.timestamp() if changed else time.time()
+        return self._store(chat_id, state, updated_at)
+
+    def _lookup(self, chat_id):
+        with self._lock:
+            entry = self._entries.get(chat_id, _MISSING)
+            if entry is not _MISSING:
+                self._entries.move_to_end(chat_id)
+            return entry
+
+    def _store(self, chat_id, state, updated_at=None):
+        entry = (state, updated_at if updated_at is not None else time.time())
+        with self._lock:
+            self._entries[chat_id] = entry
+            self._entries.move_to_end(chat_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
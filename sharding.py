@@ -0,0 +1,96 @@
+import bisect
+import hashlib
+import os
+import socket
+import time
+import uuid
+
+from config import Config
+
+
+class HashRing:
+    """Anillo de hash consistente que asigna cada servicio a un worker.
+
+    Cada worker ocupa `virtual_nodes` puntos del anillo, de modo que al
+    entrar o salir un worker solo cambia de dueño la fracción de
+    servicios que le corresponde.
+    """
+
+    def __init__(self, workers, virtual_nodes=None):
+        virtual_nodes = virtual_nodes or Config.SHARD_VIRTUAL_NODES
+        self.workers = tuple(sorted(workers))
+        points = sorted(
+            (self._hash(f"{worker}#{replica}"), worker)
+            for worker in self.workers
+            for replica in range(virtual_nodes)
+        )
+        self._keys = [point for point, _ in points]
+        self._owners = [worker for _, worker in points]
+
+    def owner(self, service_id):
+        """Worker responsable de un servicio (None si el anillo está vacío)"""
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, self._hash(str(service_id))) % len(self._keys)
+        return self._owners[index]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class ShardMembership:
+    """Pertenencia de este proceso al conjunto de workers de verificación.
+
+    Los workers publican un latido en `probe_workers`; todos construyen el
+    mismo anillo a partir de los workers vivos. Para que dos workers no
+    verifiquen el mismo servicio:
+
+    - un worker nuevo espera `SHARD_WORKER_TTL` antes de verificar, para
+      que el resto lo haya incorporado a su anillo y suelte sus servicios;
+    - un worker que no consigue renovar su latido deja de verificar antes
+      de que los demás lo den por caído y se repartan sus servicios.
+    """
+
+    def __init__(self, db, worker_id=None, ttl=None):
+        self.db = db
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.ttl = ttl or Config.SHARD_WORKER_TTL
+        self.ring = HashRing([])
+        self._joined_at = None
+        self._last_heartbeat = 0.0
+
+    def refresh(self, now=None):
+        """Renueva el latido y reconstruye el anillo si cambian los workers vivos"""
+        now = now if now is not None else time.time()
+        try:
+            self.db.heartbeat_worker(self.worker_id, now)
+            self._last_heartbeat = now
+            if self._joined_at is None:
+                self._joined_at = now
+            workers = self.db.get_live_workers(now - self.ttl)
+        except Exception as e:
+            print(f"Error renovando el latido del worker {self.worker_id}: {e}")
+            return
+
+        if tuple(sorted(workers)) != self.ring.workers:
+            self.ring = HashRing(workers)
+            print(f"🔀 Anillo de verificación: {len(workers)} workers")
+
+    def is_active(self, now=None):
+        """Si este worker puede verificar su fragmento en este momento"""
+        now = now if now is not None else time.time()
+        if self._joined_at is None or now < self._joined_at + self.ttl:
+            return False
+        # Margen de medio TTL para no solaparse con quien herede el fragmento
+        return now < self._last_heartbeat + self.ttl / 2
+
+    def owns(self, service_id):
+        return self.ring.owner(service_id) == self.worker_id
+
+    def leave(self):
+        """Abandona el anillo para que el resto se reparta el fragmento de inmediato"""
+        try:
+            self.db.remove_worker(self.worker_id)
+        except Exception as e:
+            print(f"Error dando de baja el worker {self.worker_id}: {e}")
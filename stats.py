@@ -0,0 +1,132 @@
+import math
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from models import CheckResult, CheckRollup
+from history import Bucket, MINUTE, HOUR, DAY, floor_time
+from config import Config
+
+# Niveles de agregación de más grueso a más fino; None = filas en bruto
+LEVELS = (DAY, HOUR, MINUTE, None)
+
+
+def ceil_time(ts, resolution):
+    floored = floor_time(ts, resolution)
+    return floored if floored == ts else floored + timedelta(seconds=resolution)
+
+
+class StatsManager:
+    """Estadísticas de disponibilidad y latencia servidas desde los agregados.
+
+    Cada ventana se cubre con buckets diarios en el centro, horarios y por
+    minuto en los bordes y filas en bruto solo para los extremos no
+    agregados, así que el coste apenas depende de la longitud de la ventana.
+    """
+
+    def __init__(self, db):
+        self.Session = db.Session
+
+    def window_stats(self, service_id, days=30, now=None):
+        """Estadísticas de los últimos `days` días, como mucho los que se
+        conserva el historial (ValueError si `days` no es positivo)"""
+        if not math.isfinite(days) or days <= 0:
+            raise ValueError("El número de días debe ser positivo")
+        days = min(days, Config.HISTORY_DAY_RETENTION_DAYS)
+        end = now or datetime.now()
+        return self.service_stats(service_id, end - timedelta(days=days), end)
+
+    def service_stats(self, service_id, start, end):
+        """Uptime, percentiles de latencia y número de caídas en [start, end)"""
+        if start >= end:
+            raise ValueError("El inicio debe ser anterior al final")
+        session = self.Session()
+        try:
+            watermarks = {
+                resolution: session.scalar(
+                    select(func.max(CheckRollup.bucket_start)).where(CheckRollup.resolution == resolution)
+                )
+                for resolution in (DAY, HOUR, MINUTE)
+            }
+            buckets = []
+            self._cover(session, service_id, start, end, 0, watermarks, buckets)
+        finally:
+            session.close()
+
+        buckets.sort(key=lambda bucket: bucket.start)
+        total = None
+        for bucket in buckets:
+            total = bucket if total is None else total.extend(bucket)
+
+        return self._summary(service_id, start, end, total)
+
+    def _cover(self, session, service_id, start, end, level, watermarks, buckets):
+        if start >= end:
+            return
+
+        resolution = LEVELS[level]
+        if resolution is None:
+            rows = session.execute(
+                select(CheckResult.ts, CheckResult.is_up, CheckResult.latency_ms).where(
+                    CheckResult.service_id == service_id,
+                    CheckResult.ts >= start,
+                    CheckResult.ts < end
+                )
+            )
+            buckets.extend(Bucket.from_check(ts, is_up, latency_ms) for ts, is_up, latency_ms in rows)
+            return
+
+        aligned_start = ceil_time(start, resolution)
+        aligned_end = floor_time(end, resolution)
+        # Los buckets posteriores a la marca de agua aún no existen en este nivel
+        last = watermarks[resolution]
+        if last is None:
+            aligned_end = aligned_start
+        else:
+            aligned_end = min(aligned_end, last + timedelta(seconds=resolution))
+
+        if aligned_start >= aligned_end:
+            self._cover(session, service_id, start, end, level + 1, watermarks, buckets)
+            return
+
+        rows = session.execute(
+            select(CheckRollup).where(
+                CheckRollup.service_id == service_id,
+                CheckRollup.resolution == resolution,
+                CheckRollup.bucket_start >= aligned_start,
+                CheckRollup.bucket_start < aligned_end
+            )
+        ).scalars()
+        buckets.extend(Bucket.from_rollup(row) for row in rows)
+
+        self._cover(session, service_id, start, aligned_start, level + 1, watermarks, buckets)
+        self._cover(session, service_id, aligned_end, end, level + 1, watermarks, buckets)
+
+    @staticmethod
+    def _summary(service_id, start, end, total):
+        summary = {
+            'service_id': service_id,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'checks': 0,
+            'uptime_percent': None,
+            'outages': 0,
+            'latency_ms': {'avg': None, 'p50': None, 'p95': None, 'p99': None, 'max': None},
+        }
+        if total is None or not total.checks:
+            return summary
+
+        summary['checks'] = total.checks
+        summary['uptime_percent'] = round(100.0 * total.up_checks / total.checks, 3)
+        summary['outages'] = total.outages
+        if total.up_checks:
+            # El valor representativo de un bucket puede superar el máximo real
+            percentile = lambda p: min(total.histogram.percentile(p), total.latency_max)
+            summary['latency_ms'] = {
+                'avg': round(total.latency_sum / total.up_checks, 1),
+                'p50': percentile(50),
+                'p95': percentile(95),
+                'p99': percentile(99),
+                'max': total.latency_max,
+            }
+        return summary
@@ -0,0 +1,74 @@
+import hashlib
+from collections import namedtuple
+from urllib.parse import urlsplit, urlunsplit
+
+from due_scheduler import DueScheduler
+
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'tls': 443}
+
+# Destino de verificación compartido por todos los servicios (de cualquier chat)
+# que apuntan a la misma URL normalizada con la misma comprobación de contenido
+Target = namedtuple('Target', [
+    'id', 'url', 'check_interval', 'last_checked', 'last_status', 'next_check_at',
+    'assertion_type', 'assertion_value', 'subscribers'
+])
+
+
+def normalize_url(url):
+    """Forma canónica de una URL: esquema y host en minúsculas, sin puerto por
+    defecto y sin fragmento. La ruta se conserva tal cual (con o sin barra
+    final son recursos distintos en muchos servidores); solo la vacía pasa a "/"."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        host = f'[{host}]'  # IPv6
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f'{host}:{port}'
+    if parts.username is not None:
+        userinfo = parts.username + (f':{parts.password}' if parts.password is not None else '')
+        netloc = f'{userinfo}@{netloc}'
+    path = parts.path or '/'
+    return urlunsplit((scheme, netloc, path, parts.query, ''))
+
+
+def target_fingerprint(url, assertion_type=None, assertion_value=None):
+    """Clave única de un destino: URL normalizada y comprobación de contenido"""
+    key = '\x00'.join((normalize_url(url), assertion_type or '', assertion_value or ''))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def group_targets(services):
+    """Agrupa servicios (con target_id asignado) en destinos.
+
+    Cada destino se verifica al intervalo más corto de sus suscriptores, y
+    su último estado es el del suscriptor verificado más recientemente (los
+    recién añadidos todavía no tienen estado).
+    """
+    groups = {}
+    for service in services:
+        groups.setdefault(service.target_id, []).append(service)
+
+    targets = []
+    for target_id, subscribers in groups.items():
+        first = subscribers[0]
+        checked = [service for service in subscribers if service.last_checked]
+        latest = max(checked, key=lambda service: service.last_checked) if checked else None
+        pending = [service.next_check_at for service in subscribers if service.next_check_at]
+        targets.append(Target(
+            id=target_id,
+            url=normalize_url(first.url),
+            check_interval=min(DueScheduler.interval_for(service) for service in subscribers),
+            last_checked=latest.last_checked if latest else None,
+            last_status=latest.last_status if latest else None,
+            next_check_at=min(pending) if pending else None,
+            assertion_type=first.assertion_type,
+            assertion_value=first.assertion_value,
+            subscribers=tuple(subscribers),
+        ))
+    return targets
@@ -0,0 +1,59 @@
+"""Worker de verificación para el modo fragmentado (PROBE_SHARDING=true).
+
+Cada proceso `python worker.py` verifica solo los servicios que le asigna
+el anillo de hash consistente y guarda los resultados en la base de datos
+compartida. Las alertas se dejan en `alert_outbox` para que las envíe el
+proceso líder de la aplicación web.
+"""
+import signal
+import threading
+
+from models import init_db
+from monitoring import ServiceMonitor
+from notifier import OutboxNotifier
+from sharding import ShardMembership
+from config import Config
+
+
+class ProbeWorker:
+    def __init__(self, worker_id=None):
+        self.monitor = ServiceMonitor()
+        self.membership = ShardMembership(self.monitor.db, worker_id)
+        self.outbox = OutboxNotifier(self.monitor.db)
+        self._stop = threading.Event()
+
+    def run(self):
+        print(f"🛰️ Worker de verificación {self.membership.worker_id} iniciado")
+        try:
+            while not self._stop.is_set():
+                self.tick()
+                self._stop.wait(Config.SCHEDULER_TICK_SECONDS)
+        finally:
+            self.outbox.flush()  # reintenta lo que no se pudo guardar en el último barrido
+            self.membership.leave()
+            print(f"👋 Worker {self.membership.worker_id} detenido")
+
+    def tick(self):
+        """Renueva la pertenencia al anillo y verifica los servicios vencidos del fragmento"""
+        self.membership.refresh()
+        if not self.membership.is_active():
+            return
+        try:
+            results = self.monitor.check_due_services(self.outbox, owns=self.membership.owns)
+            if results:
+                print(f"🔍 Fragmento {self.membership.worker_id}: {len(results)} servicios verificados")
+        except Exception as e:
+            print(f"Error en el barrido del worker: {e}")
+        finally:
+            self.outbox.flush()
+
+    def stop(self, *args):
+        self._stop.set()
+
+
+if __name__ == '__main__':
+    init_db()
+    worker = ProbeWorker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()